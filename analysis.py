@@ -0,0 +1,244 @@
+import math
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+MIN_REACTION_TIME = 200  # Faster responses are treated as anticipations, as in the plots
+RIDGE = 1e-2  # Small penalty on the slope so perfectly separated data still gives a finite fit
+IRLS_ITERATIONS = 50
+BOOTSTRAP_CELLS = 1_000_000  # Resample counts held in memory at once (bootstraps x trials)
+POOL_MIN_PARTICIPANTS = 16  # Below this, starting a process pool costs more than it saves
+FIT_CACHE_SIZE = 10_000
+
+# Inverse link at 75% "right", used to turn a slope into a threshold
+THRESHOLD_QUANTILE = {
+    "logistic": math.log(3),
+    "probit": 0.6744897501960817,
+}
+
+
+def _erf(x):
+    # Abramowitz & Stegun 7.1.26 (|error| < 1.5e-7); NumPy has no vectorised erf
+    sign = np.sign(x)
+    x = np.abs(x)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return sign * (1.0 - poly * np.exp(-x * x))
+
+
+def _link(model, eta):
+    """ Return (P(right), dP/deta) for the linear predictor eta """
+    if model == "logistic":
+        mu = 1.0 / (1.0 + np.exp(-eta))
+        return mu, mu * (1.0 - mu)
+    if model == "probit":
+        mu = 0.5 * (1.0 + _erf(eta / math.sqrt(2.0)))
+        return mu, np.exp(-0.5 * eta * eta) / math.sqrt(2.0 * math.pi)
+    raise ValueError(f"Unknown psychometric model {model!r}, expected one of {sorted(THRESHOLD_QUANTILE)}")
+
+
+def _solve_lines(s0, s1, s2, t0, t1):
+    """ Solve the 2x2 normal equations [[s0, s1], [s1, s2]] @ b = [t0, t1] for every batch row """
+    det = s0 * s2 - s1 * s1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (s2 * t0 - s1 * t1) / det, (s0 * t1 - s1 * t0) / det
+
+
+def _resample_counts(rng, n, size):
+    """
+    How many times each trial is drawn in each of size bootstrap resamples.
+
+    Weighting the original trials by these counts is the same as fitting the
+    resampled data, but lets every fit use the same x and reduce with BLAS.
+    """
+    idx = rng.integers(0, n, size=(size, n))
+    idx += np.arange(size)[:, None] * n
+    return np.bincount(idx.ravel(), minlength=size * n).reshape(size, n).astype(float)
+
+
+def _fit_psychometric_batch(x, y, counts, model, start=(0.0, 0.0)):
+    """
+    Fit P(right) = F(b0 + b1 * x) once per row of counts, all at once.
+
+    Each row of counts weights the trials (x, y); the fits are penalised
+    Newton / Fisher-scoring steps with the 2x2 system solved in closed form,
+    starting from start = (b0, b1).
+    """
+    x2 = x * x
+    b0 = np.full(counts.shape[0], start[0], dtype=float)
+    b1 = np.full(counts.shape[0], start[1], dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for _ in range(IRLS_ITERATIONS):
+            eta = b0[:, None] + b1[:, None] * x
+            mu, density = _link(model, eta)
+            if model == "logistic":
+                w = mu * (1.0 - mu)
+                u = y - mu
+            else:
+                variance = np.clip(mu * (1.0 - mu), 1e-12, None)
+                w = density * density / variance
+                u = density * (y - mu) / variance
+            w *= counts
+            u *= counts
+            step0, step1 = _solve_lines(
+                w.sum(axis=1), w @ x, w @ x2 + RIDGE,
+                u.sum(axis=1), u @ x - RIDGE * b1,
+            )
+            b0 += step0
+            b1 += step1
+            if np.nanmax(np.abs(step1) / (1.0 + np.abs(b1)), initial=0.0) < 1e-6:
+                break
+    return b0, b1
+
+
+def _fit_lines_batch(x, z, counts):
+    """ Ordinary least-squares line z ~ b0 + b1 * x once per row of counts """
+    sums = counts @ np.column_stack([np.ones_like(x), x, x * x, z, x * z])
+    return _solve_lines(*sums.T)
+
+
+def _bootstrap(fit, n_boot, rng, n):
+    """
+    Run fit on the data and on n_boot resamples of it, a chunk of resamples at a time.
+
+    fit takes a (batch, n) array of trial counts and returns a tuple of
+    (batch,) arrays. Returns the point estimates and the bootstrap draws.
+    """
+    estimate = [value[0] for value in fit(np.ones((1, n)))]
+    draws = [[] for _ in estimate]
+    chunk = max(1, BOOTSTRAP_CELLS // max(n, 1))
+    for start in range(0, n_boot, chunk):
+        counts = _resample_counts(rng, n, min(chunk, n_boot - start))
+        for draw, value in zip(draws, fit(counts)):
+            draw.append(value)
+    draws = [np.concatenate(draw) if draw else np.empty(0) for draw in draws]
+    return estimate, draws
+
+
+def _summary(estimate, draws):
+    """ Point estimate with a 95% percentile interval, NaN turned into None for JSON """
+    def clean(value):
+        value = float(value)
+        return None if not math.isfinite(value) else round(value, 6)
+
+    finite = draws[np.isfinite(draws)]
+    if finite.size:
+        low, high = np.percentile(finite, [2.5, 97.5])
+    else:
+        low = high = math.nan
+    return {"estimate": clean(estimate), "ci": [clean(low), clean(high)]}
+
+
+def fit_psychometric(coherence, chose_right, model="logistic", n_boot=1000, seed=0):
+    """
+    Fit P(choose right) against signed coherence, with bootstrap CIs.
+
+    Returns the bias (point of subjective equality), slope, and threshold
+    (coherence above the bias needed for 75% "right" choices).
+    """
+    x = np.asarray(coherence, dtype=float)
+    y = np.asarray(chose_right, dtype=float)
+
+    # Resamples start from the full-data fit, which saves most of the Newton steps
+    b0, b1 = _fit_psychometric_batch(x, y, np.ones((1, len(x))), model)
+    start = (b0[0], b1[0]) if np.isfinite([b0[0], b1[0]]).all() else (0.0, 0.0)
+
+    def fit(counts):
+        b0, b1 = _fit_psychometric_batch(x, y, counts, model, start)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return -b0 / b1, b1, THRESHOLD_QUANTILE[model] / b1
+
+    estimate, draws = _bootstrap(fit, n_boot, np.random.default_rng(seed), len(x))
+    return {
+        "model": model,
+        **{key: _summary(e, d) for key, e, d in zip(("bias", "slope", "threshold"), estimate, draws)},
+    }
+
+
+def fit_chronometric(coherence, reaction_time, n_boot=1000, seed=0):
+    """ Fit reaction time (ms) as a line in |coherence|, with bootstrap CIs """
+    x = np.abs(np.asarray(coherence, dtype=float))
+    rt = np.asarray(reaction_time, dtype=float)
+
+    def fit(counts):
+        return _fit_lines_batch(x, rt, counts)
+
+    estimate, draws = _bootstrap(fit, n_boot, np.random.default_rng(seed), len(x))
+    return {key: _summary(e, d) for key, e, d in zip(("intercept", "slope"), estimate, draws)}
+
+
+def group_by_participant(trials):
+    """ Split trials into {name: (coherence, chose_right, reaction_time) arrays} """
+    columns = {}
+    for trial in trials:
+        name = trial.get("name")
+        if name is None or trial["reaction_time"] <= MIN_REACTION_TIME:
+            continue
+        coherence, chose_right, reaction_time = columns.setdefault(name, ([], [], []))
+        coherence.append(trial["coherence"])
+        chose_right.append(trial["user"] == "right")
+        reaction_time.append(trial["reaction_time"])
+    return {
+        name: (np.array(c, dtype=float), np.array(r, dtype=float), np.array(t, dtype=float))
+        for name, (c, r, t) in columns.items()
+    }
+
+
+def _fit_one(job):
+    name, (coherence, chose_right, reaction_time), model, n_boot = job
+    # Seed from the name so a participant's intervals don't change between runs
+    seed = zlib.crc32(name.encode("utf-8"))
+    return name, {
+        "trials": len(coherence),
+        "psychometric": fit_psychometric(coherence, chose_right, model, n_boot, seed),
+        "chronometric": fit_chronometric(coherence, reaction_time, n_boot, seed),
+    }
+
+
+_fit_cache = OrderedDict()
+_fit_cache_lock = threading.Lock()
+
+
+def fit_participants(groups, model="logistic", n_boot=1000, processes=None, previous=None):
+    """
+    Fit every participant in groups (from group_by_participant).
+
+    Fits are cached by participant and trial count, which only grows in the
+    append-only log, so only participants with new trials are refit.
+    previous ({name: fit} from an earlier call with the same model and
+    n_boot) is reused the same way, for callers that outlive the cache.
+    Large batches are spread over a process pool.
+    """
+    fits = {}
+    jobs = []
+    previous = previous or {}
+    with _fit_cache_lock:
+        for name, columns in groups.items():
+            key = (name, len(columns[0]), model, n_boot)
+            if name in previous and previous[name]["trials"] == len(columns[0]):
+                fits[name] = previous[name]
+            elif key in _fit_cache:
+                _fit_cache.move_to_end(key)
+                fits[name] = _fit_cache[key]
+            else:
+                jobs.append((name, columns, model, n_boot))
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes > 1 and len(jobs) >= POOL_MIN_PARTICIPANTS:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            results = list(pool.map(_fit_one, jobs, chunksize=max(1, len(jobs) // (processes * 4))))
+    else:
+        results = [_fit_one(job) for job in jobs]
+
+    with _fit_cache_lock:
+        for name, fit in results:
+            fits[name] = fit
+            _fit_cache[(name, fit["trials"], model, n_boot)] = fit
+        while len(_fit_cache) > FIT_CACHE_SIZE:
+            _fit_cache.popitem(last=False)
+    return fits
@@ -1,23 +1,62 @@
 import json
+import math
 import os
 import random
-from flask import Flask, request, jsonify, render_template, send_file
-import matplotlib
-matplotlib.use('Agg')  # Use a non-GUI backend to prevent threading issues
-import matplotlib.pyplot as plt
-import pandas as pd
-import numpy as np
+import sys
+import time
+from flask import Flask, request, jsonify, render_template, Response, send_from_directory, g
+import click
+import storage
+import exports
+from leaderboard import ParticipantStats
+from metrics import Metrics
+from plot_cache import PlotCache
+from fit_cache import FitCache
+from stimulus_cache import StimulusCache
+from realized_stats import RealizedStats
+# numpy, pandas and matplotlib (analysis.py, plots.py, stimulus.py) are only
+# imported where they are used, so workers that just run trials never load them
 
 # Constants
 # Constants
-RESULTS_FILE = "results.json"
+RESULTS_FILE = "results.json"  # Legacy store, migrated into the trial store on startup
+
+# Where trials are kept: "jsonl" (append-only log) or "sqlite" (WAL database)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "jsonl")
+STORAGE_PATHS = {"jsonl": "results.jsonl", "sqlite": "results.db"}
+STORAGE_PATH = os.environ.get("STORAGE_PATH", STORAGE_PATHS.get(STORAGE_BACKEND, "results.store"))
+LEADERBOARD_PATH = os.environ.get("LEADERBOARD_PATH", "leaderboard.db")
 
 # Magnitude of the coherence bounds (internally will pick
 # left or right randomly)
 COHERENCE_LOWER_BOUND = 0
 COHERENCE_UPPER_BOUND = 0.5
 PLOT_FILE = "static/results_plot.png"
+PLOT_DIR = "static/plots"  # Rendered plots, named by content hash
+PLOT_MAX_AGE = 365 * 24 * 60 * 60  # Hashed plot files never change, so cache them for a year
 NUM_ENTRIES_NEEDED_TO_COUNT = 30
+TRIALS_PAGE_SIZE = 100  # Default number of trials per page of /api/trials
+MAX_TRIALS_PAGE_SIZE = 1000
+TRIAL_BLOCK_SIZE = 20  # Default number of trials handed out by /start_block
+MAX_TRIAL_BLOCK_SIZE = 200
+BOOTSTRAP_SAMPLES = 1000  # Resamples behind each psychometric/chronometric confidence interval
+PSYCHOMETRIC_MODELS = ["logistic", "probit"]  # Curves analysis.fit_psychometric can fit
+STIMULUS_DIR = "stimuli"  # Dot stimuli rendered ahead of the trials they were drawn for
+STIMULUS_MAX_AGE = 365 * 24 * 60 * 60  # A stimulus is fixed by its URL, so cache it for a year
+STIMULUS_RETRY_AFTER = 1  # Seconds the browser should wait for a stimulus that is still rendering
+REANALYZE_BATCH_SIZE = 1000  # Trials per batch when recomputing stimulus statistics offline
+STIMULUS_STATS_DIR = "stimulus_stats"  # Realized coherence and motion energy of each seeded trial
+ANALYZER_NICENESS = 10  # Nobody waits on realized stimuli, so the renderer and web workers go first
+FITS_DIR = "fits"  # Published psychometric fits, refreshed in the background
+# Processes the background fitter spreads big refits over; by default every
+# CPU but one, which is left for the web workers while a refit runs
+ANALYSIS_PROCESSES = int(os.environ.get("ANALYSIS_PROCESSES", max(1, (os.cpu_count() or 1) - 1)))
+# Per-worker metrics files are merged from here for /metrics
+METRICS_DIR = os.environ.get("METRICS_DIR", "metrics")
+# Requests slower than this are logged with a breakdown of where the time went
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 500))
+# "process" renders plots in a separate analytics process; "thread" renders inside the worker
+PLOT_RENDERER = os.environ.get("PLOT_RENDERER", "process")
 
 app = Flask(__name__)
 
@@ -25,132 +64,160 @@ app = Flask(__name__)
 if not os.path.exists("static"):
     os.mkdir("static")
 
-# Used to add a new trial result to the JSON file
+# Request latency and phase timings, shared across workers through METRICS_DIR
+metrics = Metrics(METRICS_DIR)
+
+# Every worker opens the same store; the first one to start imports results.json
+store = storage.open_store(STORAGE_BACKEND, STORAGE_PATH)
+store.migrate_legacy(RESULTS_FILE)
+
+# Per-participant totals behind the leaderboard, kept up to date on every save
+participant_stats = ParticipantStats(LEADERBOARD_PATH)
+participant_stats.ensure_built(store.iter_results())
+
+# Used to draw the results plots; pulls in pandas and matplotlib on first use
+def render_plots():
+    from plots import generate_plot
+    return generate_plot(load_results(), COHERENCE_UPPER_BOUND, timer=metrics.timer)
+
+# Used to run one of this app's CLI commands as a separate analytics process
+def cli_command(name):
+    return [sys.executable, "-m", "flask", "--app", os.path.abspath(__file__), name]
+
+# Plots are re-rendered in the background only when new trials have arrived,
+# by default in a short-lived analytics process running `flask render-plots`
+plot_cache = PlotCache(
+    PLOT_DIR,
+    version=store.version,
+    render=render_plots,
+    command=cli_command("render-plots") if PLOT_RENDERER == "process" else None,
+)
+
+# Used to fit every participant for each model; pulls in numpy on first use
+def fit_all_participants(previous):
+    import analysis
+    # Fits made with a different number of resamples can't be reused
+    if previous is None or previous["bootstrap"] != BOOTSTRAP_SAMPLES:
+        previous = {"models": {}}
+    with metrics.timer("group_by_participant"):
+        groups = analysis.group_by_participant(store.iter_results())
+    models = {}
+    for model in PSYCHOMETRIC_MODELS:
+        with metrics.timer("fit_psychometrics"):
+            models[model] = analysis.fit_participants(
+                groups, model, BOOTSTRAP_SAMPLES, processes=ANALYSIS_PROCESSES,
+                previous=previous["models"].get(model),
+            )
+    return {"bootstrap": BOOTSTRAP_SAMPLES, "models": models}
+
+# Used to draw one trial's dot positions; pulls in numpy on first use
+def render_stimulus(seed, coherence, direction):
+    import stimulus
+    with metrics.timer("render_stimulus"):
+        return stimulus.encode(stimulus.frames(seed, coherence, direction))
+
+# Stimuli are rendered as soon as their trials are handed out, always in a
+# long-lived analytics process running `flask render-stimuli`
+stimulus_cache = StimulusCache(
+    STIMULUS_DIR,
+    render=render_stimulus,
+    command=cli_command("render-stimuli"),
+)
+
+# Add the stimulus each trial actually showed: per-frame realized coherence and
+# motion energy up to the response, recomputed from the trial's stimulus seed
+def add_realized_stimulus(trial_results):
+    seeded = [trial for trial in trial_results if trial.get("stimulus_seed") is not None]
+    if not seeded:
+        return
+    import stimulus
+    with metrics.timer("realized_stimulus"):
+        coherences, energies = stimulus.realized(
+            [trial["stimulus_seed"] for trial in seeded],
+            [abs(trial["coherence"]) for trial in seeded],
+            [trial["correct"] for trial in seeded],
+        )
+    for trial, coherence, energy in zip(seeded, coherences, energies):
+        shown = stimulus.frames_shown(trial["reaction_time"])
+        trial["realized_coherence"] = [round(value, 4) for value in coherence[:shown].tolist()]
+        trial["motion_energy"] = [round(value, 4) for value in energy[:shown].tolist()]
+        trial["mean_realized_coherence"] = round(float(coherence[:shown].mean()), 4)
+        trial["mean_motion_energy"] = round(float(energy[:shown].mean()), 4)
+
+# Each seeded trial's realized stimulus is computed after it is saved, always
+# in a long-lived analytics process running `flask analyze-stimuli`
+realized_stats = RealizedStats(
+    STIMULUS_STATS_DIR,
+    scan=store.scan,
+    version=store.version,
+    analyze=add_realized_stimulus,
+    command=cli_command("analyze-stimuli"),
+)
+
+# Used as the version of the published fits: new trials and new fit
+# settings (like an added model) both call for a refit
+def fits_version():
+    return f"{store.version()}/{BOOTSTRAP_SAMPLES}/{'+'.join(PSYCHOMETRIC_MODELS)}"
+
+# Fits are refreshed only when new trials have arrived, always in a
+# short-lived analytics process running `flask update-fits`, never on a request
+fit_cache = FitCache(
+    FITS_DIR,
+    version=fits_version,
+    fit=fit_all_participants,
+    command=cli_command("update-fits"),
+)
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+# Record how long each request took, and log the slow ones with their phase breakdown
+@app.after_request
+def record_request_time(response):
+    elapsed = time.perf_counter() - g.request_start
+    # Label by route rule, not path, so /plots/<path:filename> is one series
+    endpoint = request.url_rule.rule if request.url_rule else "<unmatched>"
+    metrics.observe(
+        "http_request_duration_seconds", elapsed,
+        endpoint=endpoint, method=request.method, status=str(response.status_code),
+    )
+    if elapsed * 1000 > SLOW_REQUEST_MS:
+        phases = ", ".join(f"{phase}={seconds * 1000:.0f}ms" for phase, seconds in g.get("phases", {}).items())
+        app.logger.warning(
+            "Slow request: %s %s took %.0fms (%s)",
+            request.method, request.full_path.rstrip("?"), elapsed * 1000, phases or "no phases timed",
+        )
+    return response
+
+# Used to add a new trial result to the trial store
 def save_result(trial_result):
-    if os.path.exists(RESULTS_FILE):
-        # Get the existing results
-        with open(RESULTS_FILE, "r") as file:
-            try:
-                results = json.load(file)
-            except json.JSONDecodeError:
-                results = []
-    else:
-        results = []
-    # Append to existing results
-    results.append(trial_result)
-    # Save the updated results
-    with open(RESULTS_FILE, "w") as file:
-        json.dump(results, file, indent=4)
-
-# Used to load the results from the JSON file
+    store.append(trial_result)
+    participant_stats.record(trial_result)
+    realized_stats.refresh()  # Have its realized stimulus computed in the background
+
+# Used to add a batch of trial results to the trial store in one write
+def save_results(trial_results):
+    store.extend(trial_results)
+    participant_stats.record_many(trial_results)
+    realized_stats.refresh()  # Have their realized stimuli computed in the background
+
+# Used to load the results from the trial store
 def load_results():
-    """ Load results from JSON file """
-    if os.path.exists(RESULTS_FILE):
-        with open(RESULTS_FILE, "r") as file:
-            try:
-                return json.load(file)
-            except json.JSONDecodeError:
-                return []
-    return []
-
-# Generate desired plots
-def generate_plot():
-    results = load_results()
-    if not results:
-        return  # No data to plot
-
-    results = [entry for entry in results if entry["reaction_time"] > 200]
-
-    df = pd.DataFrame(results)
-    print(df)
-    df['choice_right'] = df['user'] == 'right'
-
-    num_bins = 10  # Adjust based on data density
-    df['coherence_bin'] = pd.cut(
-        df['coherence'],
-        bins=np.linspace(-COHERENCE_UPPER_BOUND, COHERENCE_UPPER_BOUND, num_bins + 1),
-        labels=False,
-        include_lowest=True
-    )
+    """ Load results from the trial store """
+    with metrics.timer("load_results"):
+        return store.load()
 
-    bin_means = df.groupby('coherence_bin')['coherence'].mean()
-    prob_right = df.groupby('coherence_bin')['choice_right'].mean()
-
-    # --- P(Choosing Right) vs. Coherence ---
-
-    plt.figure(figsize=(6, 4))
-    plt.plot(bin_means, prob_right, marker='o', linestyle='-', label="P(choose right)")
-    plt.xlabel("Coherence Value")
-    plt.ylabel("P(Choose Right)")
-    plt.title("P(Choosing Right) vs. Coherence")
-    plt.ylim(0, 1.2)
-    plt.xlim(-COHERENCE_UPPER_BOUND, COHERENCE_UPPER_BOUND)
-    plt.axhline(0.5, linestyle="--", color="gray", alpha=0.6)
-    plt.axvline(0, linestyle="--", color="gray", alpha=0.6)
-    plt.grid()
-    plt.savefig("static/prob_choose_right.png")
-    plt.close()
-
-    # --- Reaction Time vs. Coherence ---
-    trials = list(range(1, len(results) + 1))
-    coherence = [r["coherence"] for r in results]
-    reaction_times = [r["reaction_time"] for r in results]
-    correct_guesses = [r["correct_guess"] for r in results]
-    colors = ["green" if correct else "red" for correct in correct_guesses]
-
-    plt.figure(figsize=(6, 4))
-    plt.scatter(coherence, reaction_times, c=colors, edgecolors="black")
-    plt.xlabel("Coherence")
-    plt.ylabel("Reaction Times (ms)")
-    plt.title("Reaction Time vs Coherence")
-    plt.ylim(0, 2200)
-    plt.xlim(-COHERENCE_UPPER_BOUND, COHERENCE_UPPER_BOUND)
-    plt.grid(True)
-    plt.savefig("static/reaction_time_vs_coherence.png")
-    plt.close()
-
-    # --- Probability Correct vs. Coherence ---
-    percentage_correct = df.groupby('coherence_bin')['correct_guess'].mean()
-
-    plt.figure(figsize=(6, 4))
-    plt.plot(bin_means, percentage_correct, marker='o', linestyle='-')
-    plt.xlabel("Coherence Bin")
-    plt.ylabel("Probability Correct")
-    plt.title("Probability Correct vs Coherence")
-    plt.ylim(0, 1.2)
-    plt.xlim(-COHERENCE_UPPER_BOUND, COHERENCE_UPPER_BOUND)
-    plt.grid(True)
-    plt.savefig("static/probability_correct.png")
-    plt.close()
 def get_curr_leader():
-    results = load_results()
-    if not results:
-        return  # No data to plot
-    df = pd.DataFrame(results)
-    # Get the number of entries for each person
-    counts_by_name = df.groupby('name').size()
-
-    # Get the indices of the people who have enough entries
-    valid_names = counts_by_name[counts_by_name >= NUM_ENTRIES_NEEDED_TO_COUNT].index
-
-    # Filter the data to only include people with enough entries, then group by those people
-    filtered_data_by_people = df[df['name'].isin(valid_names)].groupby('name')
-    if len(filtered_data_by_people) == 0:
+    if not participant_stats.has_trials():
+        return  # No data to rank
+    # Only people with enough entries count, ranked by the weighted accuracy/speed score
+    top_3 = participant_stats.top(NUM_ENTRIES_NEEDED_TO_COUNT, limit=3)
+    if len(top_3) == 0:
         return None
 
-    # Get the mean of each person's accuracy and reaction time
-    person_accuracy_averages = filtered_data_by_people['correct_guess'].mean()
-    person_reaction_time_averages = filtered_data_by_people['reaction_time'].mean() / 1000
-    # Weigh accuracy 2 times more than speed
-    speed_and_accuracy_weighted_average =  person_accuracy_averages + (2-person_reaction_time_averages)/2
-    # Sum the following formula to obtain a ranking:
-    # Scales reaction time to seconds and looks at 2- reaction time and takes into account how many correct
-
-    # Get the top 3 players
-    top_3 = speed_and_accuracy_weighted_average.nlargest(3)
-
     # Convert to a dictionary with rankings
-    rankings = {idx + 1: (name, round(score, 3)) for idx, (name, score) in enumerate(top_3.items())}
+    rankings = {idx + 1: (name, round(score, 3)) for idx, (name, score) in enumerate(top_3)}
 
     return rankings
 
@@ -162,25 +229,111 @@ def home():
 # Show the results page
 @app.route('/results_page')
 def show_results():
-    results = load_results()
-    generate_plot()  # Generate the plot before rendering
-    leaderboard = get_curr_leader()
-    print(f"leaderboard: {leaderboard}")
-    return render_template('results.html', data=results, plot_file = PLOT_FILE, leaderboard=leaderboard)
-
-# Called from JS to get the coherence and direction for each trial
-@app.route('/start_trial', methods=['POST'])
-def start_trial():
-    """ Send a new trial's parameters to the frontend """
-    coherence = round(random.uniform(COHERENCE_LOWER_BOUND, COHERENCE_UPPER_BOUND), 2)
-    direction = random.choice(["left", "right"])
-    return jsonify({"coherence": coherence, "direction": direction})
-
-# Called from JS to save the user's response ("left" or "right")
-@app.route('/submit_response', methods=['POST'])
-def submit_response():
-    """ Save the user's response """
-    data = request.json
+    plot_cache.refresh()  # Kick off a re-render if the plots are out of date
+    manifest = plot_cache.manifest()
+    plots = manifest["files"] if manifest else None
+    with metrics.timer("get_curr_leader"):
+        leaderboard = get_curr_leader()
+    with metrics.timer("render_template"):
+        return render_template('results.html', plot_file = PLOT_FILE, plots=plots, leaderboard=leaderboard)
+
+# One page of trials for the results table, oldest first
+@app.route('/api/trials')
+def list_trials():
+    """ Return up to `limit` trials after `cursor`, optionally filtered by name and coherence """
+    # Cursors are byte offsets or row ids handed out by earlier pages, so never negative
+    try:
+        cursor = int(request.args.get("cursor", 0))
+    except ValueError:
+        cursor = -1
+    if cursor < 0:
+        return jsonify({"error": "Expected cursor to be a non-negative integer"}), 400
+    bounds = {}
+    for bound in ("min_coherence", "max_coherence"):
+        value = request.args.get(bound)
+        try:
+            bounds[bound] = None if value is None else float(value)
+        except ValueError:
+            bounds[bound] = math.nan
+        if bounds[bound] is not None and not math.isfinite(bounds[bound]):
+            return jsonify({"error": f"Expected {bound} to be a number"}), 400
+    if None not in bounds.values() and bounds["min_coherence"] > bounds["max_coherence"]:
+        return jsonify({"error": "Expected min_coherence to be at most max_coherence"}), 400
+    limit = request.args.get("limit", TRIALS_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_TRIALS_PAGE_SIZE))
+    with metrics.timer("load_trials_page"):
+        trials, next_cursor = store.page(
+            cursor=cursor,
+            limit=limit,
+            name=request.args.get("name") or None,
+            **bounds,
+        )
+    return jsonify({"trials": trials, "next_cursor": next_cursor})
+
+# Per-participant psychometric and chronometric fits with bootstrap CIs
+@app.route('/api/psychometrics')
+def psychometrics():
+    """ Return the latest {name: fit} for participants with at least `min_trials` trials """
+    model = request.args.get("model", "logistic")
+    if model not in PSYCHOMETRIC_MODELS:
+        return jsonify({"error": f"Unknown model {model!r}"}), 400
+    min_trials = request.args.get("min_trials", NUM_ENTRIES_NEEDED_TO_COUNT, type=int)
+    fit_cache.refresh()  # Kick off a refit if new trials have arrived
+    published = fit_cache.published()
+    # Fits published before this model was added don't have it yet
+    if published is None or model not in published["fits"]["models"]:
+        return jsonify({"status": "pending", "fits": {}}), 202
+    fits = published["fits"]["models"][model]
+    return jsonify({
+        "status": "ready",
+        # Fits may trail the newest trials while the next refit runs
+        "up_to_date": published["version"] == fits_version(),
+        "fits": {name: fit for name, fit in fits.items() if fit["trials"] >= min_trials},
+    })
+
+# Serve a rendered plot; the name contains its content hash so it can be cached forever
+@app.route('/plots/<path:filename>')
+def plot_file(filename):
+    response = send_from_directory(PLOT_DIR, filename, max_age=PLOT_MAX_AGE)
+    response.cache_control.immutable = True
+    return response
+
+# Pick the coherence and direction for one trial
+def draw_trial(rng):
+    coherence = round(rng.uniform(COHERENCE_LOWER_BOUND, COHERENCE_UPPER_BOUND), 2)
+    direction = rng.choice(["left", "right"])
+    # Seeds the server-side dot stimulus, so the exact trial can be replayed
+    stimulus_seed = rng.randrange(2 ** 32)
+    return {"coherence": coherence, "direction": direction, "stimulus_seed": stimulus_seed}
+
+def _is_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+# Used to check one response sent from JS before it is turned into a trial record
+def response_error(data):
+    """ Return why a response can't be stored, or None if it can """
+    if not isinstance(data, dict):
+        return "Expected a JSON object"
+    if data.get("name") is not None and not isinstance(data["name"], str):
+        return "Expected name to be a string"
+    if data.get("response") not in ("left", "right"):
+        return "Expected response to be left or right"
+    if data.get("correct_response") not in ("left", "right"):
+        return "Expected correct_response to be left or right"
+    if not _is_number(data.get("coherence")) or not 0 <= data["coherence"] <= 1:
+        return "Expected coherence to be a number in [0, 1]"
+    if not _is_number(data.get("reaction_time")) or data["reaction_time"] < 0:
+        return "Expected reaction_time to be a non-negative number of ms"
+    seed = data.get("stimulus_seed")
+    if seed is not None and (not _is_integer(seed) or seed < 0):
+        return "Expected stimulus_seed to be a non-negative integer"
+    return None
+
+# Turn one response sent from JS into the trial record we store
+def build_trial_result(data):
     name = data.get("name")
     user_response = data.get("response")
     correct_response = data.get("correct_response")
@@ -200,18 +353,217 @@ def submit_response():
             # and positive if the dots are moving to the right
         "reaction_time": min(reaction_time, 2000)  # Cap reaction time at 2000 ms
     }
+    # Trials from /start_trial or /start_block carry the seed of the stimulus they showed
+    if data.get("stimulus_seed") is not None:
+        trial_result["stimulus_seed"] = int(data["stimulus_seed"])
+    return trial_result
+
+# Called from JS to get the coherence and direction for each trial
+@app.route('/start_trial', methods=['POST'])
+def start_trial():
+    """ Send a new trial's parameters to the frontend """
+    trial = draw_trial(random)
+    stimulus_cache.request([trial])
+    return jsonify(trial)
+
+# Called from JS to get the parameters for a whole block of trials at once
+@app.route('/start_block', methods=['POST'])
+def start_block():
+    """ Send `size` trials drawn from an RNG seeded with `seed`, so the schedule can be replayed """
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    try:
+        size = int(data.get("size", TRIAL_BLOCK_SIZE))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Expected size to be an integer"}), 400
+    size = max(1, min(size, MAX_TRIAL_BLOCK_SIZE))
+    seed = data.get("seed")
+    if seed is None:
+        seed = random.SystemRandom().randrange(2 ** 32)
+    elif not _is_integer(seed):
+        return jsonify({"error": "Expected seed to be an integer"}), 400
+    rng = random.Random(seed)
+    trials = [draw_trial(rng) for _ in range(size)]
+    stimulus_cache.request(trials)
+    return jsonify({"seed": seed, "trials": trials})
 
+# Called from JS to save the user's response ("left" or "right")
+@app.route('/submit_response', methods=['POST'])
+def submit_response():
+    """ Save the user's response """
+    data = request.get_json(silent=True)
+    error = response_error(data)
+    if error:
+        return jsonify({"error": error}), 400
+    trial_result = build_trial_result(data)
     save_result(trial_result)
-    return jsonify({"correct": is_correct})
+    return jsonify({"correct": trial_result["correct_guess"]})
+
+# Called from JS with a batch of responses, e.g. at the end of a block or when the page closes
+@app.route('/submit_responses', methods=['POST'])
+def submit_responses():
+    """ Save a batch of the user's responses in one write """
+    # sendBeacon can't set a JSON content type, so don't insist on one
+    data = request.get_json(force=True, silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("responses"), list):
+        return jsonify({"error": "Expected {\"responses\": [...]}"}), 400
+    # A bad entry is skipped and reported rather than failing the batch, since a
+    # sendBeacon flush is never retried and would lose every good trial with it
+    trial_results = []
+    correct = []
+    errors = []
+    for index, response in enumerate(data["responses"]):
+        error = response_error(response)
+        if error:
+            errors.append({"index": index, "error": error})
+            correct.append(None)
+            continue
+        trial_result = build_trial_result(response)
+        trial_results.append(trial_result)
+        correct.append(trial_result["correct_guess"])
+    if errors and not trial_results:
+        return jsonify({"correct": correct, "errors": errors}), 400
+    save_results(trial_results)
+    return jsonify({"correct": correct, "errors": errors})
+
+# Called from JS to get the dot positions for a trial, rendered ahead of time
+@app.route('/stimulus/<int:seed>')
+def get_stimulus(seed):
+    """ Send (frames, dots, x/y) little-endian uint16 positions in hundredths of a pixel for the seeded trial """
+    coherence = request.args.get("coherence", type=float)
+    direction = request.args.get("direction")
+    # draw_trial only hands out coherences on the 0.01 grid within the bounds
+    if (
+        coherence is None
+        or not COHERENCE_LOWER_BOUND <= coherence <= COHERENCE_UPPER_BOUND
+        or round(coherence, 2) != coherence
+        or direction not in ("left", "right")
+    ):
+        return jsonify({
+            "error": f"Expected coherence in [{COHERENCE_LOWER_BOUND}, {COHERENCE_UPPER_BOUND}] "
+                     "in steps of 0.01 and direction left or right",
+        }), 400
+    filename = stimulus_cache.path(seed, coherence, direction)
+    if filename is None:
+        if stimulus_cache.pending(seed, coherence, direction):
+            # Handed out but not rendered yet; have the browser retry
+            response = jsonify({"status": "pending"})
+            response.status_code = 503
+            response.headers["Retry-After"] = str(STIMULUS_RETRY_AFTER)
+            return response
+        # The renderer may have finished it between the two checks
+        filename = stimulus_cache.path(seed, coherence, direction)
+    if filename is None:
+        # Never handed out by /start_trial or /start_block, or expired; the page draws its own dots
+        return jsonify({"error": "Unknown stimulus"}), 404
+    response = send_from_directory(
+        os.path.abspath(STIMULUS_DIR), filename, mimetype="application/octet-stream", max_age=STIMULUS_MAX_AGE,
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
-# Allow users to download the results JSON file
+# Latency histograms for every worker, in Prometheus text format
+@app.route('/metrics')
+def show_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# Allow users to download the results as JSON, NDJSON or CSV, optionally gzipped
 @app.route('/download_results')
 def download_results():
-    """Allow users to download the results JSON file."""
-    if os.path.exists(RESULTS_FILE):
-        return send_file(RESULTS_FILE, as_attachment=True)
-    else:
+    """Stream every trial to the user, one row at a time."""
+    if store.version() == 0:
         return "No results available.", 404
+    file_format = request.args.get("format", "json")
+    if file_format not in exports.FORMATS:
+        return f"Unknown format {file_format!r}.", 400
+    rows, mimetype, extension = exports.FORMATS[file_format]
+    # Realized stimuli trail the newest trials by however long the analyzer takes
+    chunks = rows(realized_stats.merge(store.scan()))
+    filename = f"results.{extension}"
+    if request.args.get("compress") == "gzip":
+        chunks = exports.gzip_stream(chunks)
+        mimetype = "application/gzip"
+        filename += ".gz"
+    return Response(
+        chunks,
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+# Recompute the leaderboard totals from the trial log, e.g. after a crash
+# between a trial being saved and its totals being updated
+@app.cli.command("rebuild-leaderboard")
+def rebuild_leaderboard():
+    """Rebuild the leaderboard totals from the trial store."""
+    participant_stats.rebuild(store.iter_results())
+    print("Leaderboard rebuilt.")
+
+# Fit every participant offline and print the fits as JSON
+@app.cli.command("fit-psychometrics")
+@click.option("--model", type=click.Choice(PSYCHOMETRIC_MODELS), default="logistic")
+@click.option("--bootstrap", "n_boot", default=BOOTSTRAP_SAMPLES, show_default=True, help="Bootstrap resamples per fit.")
+@click.option("--min-trials", default=1, show_default=True, help="Skip participants with fewer trials.")
+@click.option("--processes", type=int, default=None, help="Worker processes (default: one per CPU).")
+def fit_psychometrics(model, n_boot, min_trials, processes):
+    """Fit psychometric and chronometric curves for every participant."""
+    import analysis
+    groups = analysis.group_by_participant(store.iter_results())
+    groups = {name: columns for name, columns in groups.items() if len(columns[0]) >= min_trials}
+    fits = analysis.fit_participants(groups, model, n_boot, processes=processes)
+    print(json.dumps(fits, indent=4))
+
+# Recompute the realized stimulus of every seeded trial and print it as NDJSON
+@app.cli.command("reanalyze-stimuli")
+def reanalyze_stimuli():
+    """Regenerate each seeded trial's stimulus and print its realized coherence and motion energy."""
+    batch = []
+    for trial in store.iter_results():
+        if trial.get("stimulus_seed") is not None:
+            batch.append(trial)
+        if len(batch) == REANALYZE_BATCH_SIZE:
+            add_realized_stimulus(batch)
+            print("\n".join(json.dumps(seeded) for seeded in batch))
+            batch = []
+    if batch:
+        add_realized_stimulus(batch)
+        print("\n".join(json.dumps(seeded) for seeded in batch))
+
+# Run by the stimulus cache as a separate analytics process; it already holds the build lock
+@app.cli.command("render-stimuli")
+def render_stimuli_command():
+    """Render queued dot stimuli as they arrive, until the queue has been quiet for a while."""
+    metrics.periodic = False  # Timings go to one shared file via flush_cumulative below
+    # Keep the phase timings for /metrics after every batch, since this process runs for minutes
+    stimulus_cache.watch(on_build=lambda: metrics.flush_cumulative("render-stimuli"))
+
+# Run by the realized-stimulus table as a separate analytics process; it already holds the build lock
+@app.cli.command("analyze-stimuli")
+def analyze_stimuli_command():
+    """Compute the realized stimulus of newly saved trials as they arrive, until none have come for a while."""
+    metrics.periodic = False  # Timings go to one shared file via flush_cumulative below
+    os.nice(ANALYZER_NICENESS)
+    # Keep the phase timings for /metrics after every batch, since this process runs for minutes
+    realized_stats.watch(on_build=lambda: metrics.flush_cumulative("analyze-stimuli"))
+
+# Run by the fit cache as a separate analytics process; it already holds the build lock
+@app.cli.command("update-fits")
+def update_fits_command():
+    """Fit every participant for the current data and publish the fits."""
+    metrics.periodic = False  # Timings go to one shared file via flush_cumulative below
+    fit_cache.rebuild()
+    metrics.flush_cumulative("update-fits")  # Keep the phase timings for /metrics
+
+# Run by the plot cache as a separate analytics process; it already holds the build lock
+@app.cli.command("render-plots")
+def render_plots_command():
+    """Render the results plots for the current data and publish them."""
+    metrics.periodic = False  # Timings go to one shared file via flush_cumulative below
+    plot_cache.rebuild()
+    metrics.flush_cumulative("render-plots")  # Keep the phase timings for /metrics
 
 
 if __name__ == '__main__':
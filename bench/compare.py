@@ -0,0 +1,58 @@
+"""
+Compare two load_test.py reports, e.g. from two commits.
+
+Prints throughput and latency per endpoint side by side. Exits with status
+1 if any endpoint's p95 latency got worse by more than --threshold percent,
+or if the newer run lost writes.
+
+    python bench/compare.py bench/results/old.json bench/results/new.json --threshold 20
+"""
+import argparse
+import json
+import sys
+
+METRICS = ["throughput_rps", "p50_ms", "p95_ms", "p99_ms"]
+
+
+def change(old, new):
+    if old is None or new is None or old == 0:
+        return None
+    return 100 * (new - old) / old
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=20, help="Allowed p95 slowdown in percent.")
+    args = parser.parse_args()
+
+    with open(args.old) as file:
+        old = json.load(file)
+    with open(args.new) as file:
+        new = json.load(file)
+
+    print(f"old: {old.get('commit')}  new: {new.get('commit')}")
+    regressed = []
+    for endpoint in sorted(set(old["endpoints"]) | set(new["endpoints"])):
+        before = old["endpoints"].get(endpoint, {})
+        after = new["endpoints"].get(endpoint, {})
+        print(endpoint)
+        for metric in METRICS:
+            delta = change(before.get(metric), after.get(metric))
+            delta_text = "" if delta is None else f" ({delta:+.1f}%)"
+            print(f"    {metric:<15} {before.get(metric)!s:>10} -> {after.get(metric)!s:>10}{delta_text}")
+        delta = change(before.get("p95_ms"), after.get("p95_ms"))
+        if delta is not None and delta > args.threshold:
+            regressed.append(endpoint)
+
+    lost = new["writes"]["lost"]
+    print(f"lost writes: {old['writes']['lost']} -> {lost}")
+    if regressed:
+        print(f"p95 regressed by more than {args.threshold}% on: {', '.join(regressed)}")
+    if regressed or lost:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Generate a synthetic trial log for benchmarking.
+
+Each simulated participant gets their own sensitivity, bias and speed, so
+the data has realistic psychometric and chronometric structure. Trials
+are written in batches, so 1M-trial logs don't need 1M trials in memory.
+
+    python bench/generate_data.py --trials 100000 --names 500 --format jsonl --out results.jsonl
+    python bench/generate_data.py --trials 1000 --format json --out results.json
+"""
+import argparse
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import exports
+import storage
+
+COHERENCE_UPPER_BOUND = 0.5
+BATCH_SIZE = 10000
+
+
+def generate_trials(num_trials, num_names, seed=0):
+    """ Yield num_trials synthetic trial records spread across num_names participants """
+    rng = random.Random(seed)
+    participants = [
+        {
+            "name": f"participant{i:05d}",
+            "sensitivity": rng.uniform(4, 20),  # Logistic slope on signed coherence
+            "bias": rng.gauss(0, 0.03),
+            "base_rt": rng.uniform(500, 1100),  # ms at zero coherence
+        }
+        for i in range(num_names)
+    ]
+    for _ in range(num_trials):
+        person = rng.choice(participants)
+        coherence = round(rng.uniform(0, COHERENCE_UPPER_BOUND), 2)
+        direction = rng.choice(["left", "right"])
+        signed = coherence * (1 if direction == "right" else -1)
+        p_right = 1 / (1 + math.exp(-person["sensitivity"] * (signed - person["bias"])))
+        response = "right" if rng.random() < p_right else "left"
+        reaction_time = person["base_rt"] * (1 - coherence) + rng.gauss(0, 120)
+        yield {
+            "name": person["name"],
+            "correct": direction,
+            "user": response,
+            "correct_guess": response == direction,
+            "coherence": signed,
+            "reaction_time": int(min(max(reaction_time, 150), 2000)),
+        }
+
+
+def write_trials(trials, file_format, out):
+    """ Write trials as a legacy results.json array, or into a jsonl/sqlite trial store """
+    if file_format == "json":
+        with open(out, "w") as file:
+            for chunk in exports.json_rows(trials):
+                file.write(chunk)
+        return
+    store = storage.open_store(file_format, out)
+    batch = []
+    for trial in trials:
+        batch.append(trial)
+        if len(batch) == BATCH_SIZE:
+            store.extend(batch)
+            batch = []
+    store.extend(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=10000, help="Number of trials (e.g. 1000 to 1000000).")
+    parser.add_argument("--names", type=int, default=100, help="Number of distinct participants.")
+    parser.add_argument("--format", choices=["json", *storage.BACKENDS], default="jsonl")
+    parser.add_argument("--out", required=True, help="File to write; must not exist yet.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if os.path.exists(args.out):
+        parser.error(f"{args.out} already exists")
+    write_trials(generate_trials(args.trials, args.names, args.seed), args.format, args.out)
+    print(f"Wrote {args.trials} trials for {args.names} participants to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
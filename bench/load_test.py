@@ -0,0 +1,266 @@
+"""
+Load-test the app with simulated participants and results-page viewers.
+
+Starts the app in a scratch directory (under Flask's threaded server or a
+local gunicorn), optionally seeded with a synthetic trial log, then runs
+participant threads that loop over /start_trial and /submit_response (or
+/start_block and /submit_responses), fetching each trial's /stimulus and
+sending its seed back like the task page, and viewer threads that load
+/results_page. Reports throughput and p50/p95/p99 latency per endpoint,
+and compares the trials acknowledged to the client with the trials that
+actually reached the store to count lost writes.
+
+    python bench/load_test.py --server gunicorn --seed-trials 100000 --output bench/results/$(git rev-parse --short HEAD).json
+    python bench/compare.py bench/results/old.json bench/results/new.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import storage
+from generate_data import generate_trials, write_trials
+
+STORE_FILES = {"jsonl": "results.jsonl", "sqlite": "results.db"}
+STIMULUS_RETRIES = 5  # Times a participant retries a stimulus that is still rendering, like the task page
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(kind, workdir, port, backend, workers):
+    """ Start the app with its data files in workdir and wait until it answers """
+    env = dict(os.environ, PORT=str(port), STORAGE_BACKEND=backend, PYTHONPATH=REPO_ROOT)
+    if kind == "gunicorn":
+        command = ["gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}", "app:app"]
+    else:
+        command = [sys.executable, os.path.join(REPO_ROOT, "app.py")]
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 120  # Seeding leaderboard totals from a big log takes a while
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{kind} server exited with code {process.returncode}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1).read()
+            return process
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{kind} server did not start within 120 s")
+
+
+class Recorder:
+    """ Thread-safe collection of per-endpoint latencies and errors """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.statuses = {}  # path -> {HTTP status: count} for non-2xx answers
+        self.acknowledged = 0
+
+    def request(self, base_url, endpoint, payload=None, label=None):
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        req = urllib.request.Request(
+            base_url + endpoint,
+            data=data,
+            method="GET" if data is None else "POST",
+            headers={"Content-Type": "application/json"},
+        )
+        path = label or endpoint.split("?")[0]
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=60) as response:
+                body = response.read()
+        except urllib.error.HTTPError as error:
+            # Answered, just not with a 2xx (e.g. a 503 for a stimulus still rendering)
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.latencies.setdefault(path, []).append(elapsed)
+                counts = self.statuses.setdefault(path, {})
+                counts[str(error.code)] = counts.get(str(error.code), 0) + 1
+            return None
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            with self.lock:
+                self.errors[path] = self.errors.get(path, 0) + 1
+            return None
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies.setdefault(path, []).append(elapsed)
+        return body
+
+
+def participant(recorder, base_url, stop, client, block_size, trial_ms, index):
+    rng = random.Random(index)
+    name = f"bench{index:04d}"
+    while not stop.is_set():
+        if client == "block":
+            body = recorder.request(base_url, "/start_block", {"size": block_size})
+            trials = json.loads(body)["trials"] if body else []
+        else:
+            body = recorder.request(base_url, "/start_trial", {})
+            trials = [json.loads(body)] if body else []
+        for trial in trials:
+            query = urllib.parse.urlencode({"coherence": trial["coherence"], "direction": trial["direction"]})
+            for _ in range(STIMULUS_RETRIES + 1):
+                endpoint = f"/stimulus/{trial['stimulus_seed']}?{query}"
+                if recorder.request(base_url, endpoint, label="/stimulus/<seed>") is not None:
+                    break
+                time.sleep(0.2)
+            time.sleep(trial_ms / 1000)  # Watching the dots and responding
+        responses = [
+            {
+                "name": name,
+                "response": rng.choice(["left", "right"]),
+                "correct_response": trial["direction"],
+                "coherence": trial["coherence"],
+                "reaction_time": rng.randint(250, 1500),
+                "stimulus_seed": trial["stimulus_seed"],
+            }
+            for trial in trials
+        ]
+        if client == "block":
+            if responses and recorder.request(base_url, "/submit_responses", {"responses": responses}):
+                with recorder.lock:
+                    recorder.acknowledged += len(responses)
+        else:
+            for response in responses:
+                if recorder.request(base_url, "/submit_response", response):
+                    with recorder.lock:
+                        recorder.acknowledged += 1
+
+
+def viewer(recorder, base_url, stop):
+    while not stop.is_set():
+        recorder.request(base_url, "/results_page")
+        recorder.request(base_url, "/api/trials?limit=100")
+
+
+def percentile(sorted_values, q):
+    """ Nearest-rank percentile of an already sorted list """
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(q / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(recorder, duration):
+    endpoints = {}
+    for path in sorted(set(recorder.latencies) | set(recorder.errors)):
+        values = sorted(recorder.latencies.get(path, []))
+        endpoints[path] = {
+            "requests": len(values),
+            "errors": recorder.errors.get(path, 0),
+            "statuses": recorder.statuses.get(path, {}),
+            "throughput_rps": round(len(values) / duration, 2),
+            "mean_ms": round(1000 * sum(values) / len(values), 2) if values else None,
+            **{f"p{q}_ms": round(1000 * percentile(values, q), 2) if values else None for q in (50, 95, 99)},
+        }
+    return endpoints
+
+
+def count_trials(backend, path):
+    if not os.path.exists(path):
+        return 0
+    return sum(1 for _ in storage.open_store(backend, path).iter_results())
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=["flask", "gunicorn"], default="flask")
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes.")
+    parser.add_argument("--backend", choices=sorted(storage.BACKENDS), default="jsonl")
+    parser.add_argument("--seed-trials", type=int, default=1000, help="Synthetic trials in the log before the run.")
+    parser.add_argument("--seed-names", type=int, default=100, help="Participants in the synthetic log.")
+    parser.add_argument("--participants", type=int, default=8, help="Concurrent simulated participants.")
+    parser.add_argument("--viewers", type=int, default=2, help="Concurrent results-page viewers.")
+    parser.add_argument("--client", choices=["trial", "block"], default="trial",
+                        help="Per-trial endpoints, or block scheduling with bulk submission.")
+    parser.add_argument("--block-size", type=int, default=20)
+    parser.add_argument("--trial-ms", type=float, default=0,
+                        help="Time each simulated participant spends on a trial, which gives the renderer a head start.")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run the load for.")
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout.")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="dots-bench-")
+    store_path = os.path.join(workdir, STORE_FILES[args.backend])
+    write_trials(generate_trials(args.seed_trials, args.seed_names), args.backend, store_path)
+    before = count_trials(args.backend, store_path)
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = start_server(args.server, workdir, port, args.backend, args.workers)
+    recorder = Recorder()
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=participant, args=(recorder, base_url, stop, args.client, args.block_size, args.trial_ms, i))
+        for i in range(args.participants)
+    ] + [threading.Thread(target=viewer, args=(recorder, base_url, stop)) for _ in range(args.viewers)]
+    try:
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+
+    stored = count_trials(args.backend, store_path) - before
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": vars(args),
+        "duration_s": round(elapsed, 2),
+        "endpoints": summarize(recorder, elapsed),
+        "writes": {
+            "acknowledged": recorder.acknowledged,
+            "stored": stored,
+            "lost": max(recorder.acknowledged - stored, 0),
+        },
+    }
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    else:
+        report["workdir"] = workdir
+
+    text = json.dumps(report, indent=4)
+    print(text)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Measure what one web worker costs to start: import time and resident memory.
+
+Imports app in a fresh interpreter (in a scratch directory, like a gunicorn
+worker booting), then serves one trial through the test client the way
+the task page does (fetching its stimulus, waiting for the renderer if
+need be, and sending the seed back with the response), and reports the
+wall time and peak RSS after each step, plus whether the analysis stack
+(numpy, pandas, matplotlib) got loaded.
+
+    python bench/worker_footprint.py --runs 5 --output bench/results/footprint.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, resource, sys, time
+from urllib.parse import urlencode
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+rss_after_import = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+client = app.app.test_client()
+trial = client.post("/start_trial").get_json()
+query = urlencode({"coherence": trial["coherence"], "direction": trial["direction"]})
+deadline = time.time() + 60
+while client.get(f"/stimulus/{trial['stimulus_seed']}?{query}").status_code == 503 and time.time() < deadline:
+    time.sleep(0.2)  # Still being rendered by the analytics process
+client.post("/submit_response", json={
+    "name": "footprint", "response": "left", "correct_response": trial["direction"],
+    "coherence": trial["coherence"], "reaction_time": 500, "stimulus_seed": trial["stimulus_seed"],
+})
+print(json.dumps({
+    "import_s": imported,
+    "rss_after_import_kb": rss_after_import,
+    "rss_after_trial_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "heavy_modules": sorted(m for m in ("numpy", "pandas", "matplotlib") if m in sys.modules),
+}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout.")
+    args = parser.parse_args()
+
+    samples = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory(prefix="dots-footprint-") as workdir:
+            env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+            output = subprocess.run(
+                [sys.executable, "-c", PROBE], cwd=workdir, env=env, capture_output=True, text=True, check=True
+            ).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    report = {
+        "runs": args.runs,
+        "import_s_median": round(statistics.median(s["import_s"] for s in samples), 4),
+        "rss_after_import_mb_median": round(statistics.median(s["rss_after_import_kb"] for s in samples) / 1024, 1),
+        "rss_after_trial_mb_median": round(statistics.median(s["rss_after_trial_kb"] for s in samples) / 1024, 1),
+        "heavy_modules": samples[-1]["heavy_modules"],
+    }
+    text = json.dumps(report, indent=4)
+    print(text)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import csv
+import io
+import json
+import zlib
+
+# Columns written to CSV downloads, in order
+TRIAL_FIELDS = [
+    "name", "correct", "user", "correct_guess", "coherence", "reaction_time",
+    "stimulus_seed", "mean_realized_coherence", "mean_motion_energy",
+]
+
+# Bytes of output to collect before handing a chunk to the WSGI server
+CHUNK_SIZE = 64 * 1024
+
+
+def _chunked(pieces):
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= CHUNK_SIZE:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def json_rows(trials):
+    """ Stream trials as the same pretty-printed JSON array results.json used to hold """
+    def pieces():
+        yield "["
+        first = True
+        for trial in trials:
+            body = json.dumps(trial, indent=4).replace("\n", "\n    ")
+            yield ("\n    " if first else ",\n    ") + body
+            first = False
+        yield "]" if first else "\n]"
+    return _chunked(pieces())
+
+
+def ndjson_rows(trials):
+    """ Stream trials as newline-delimited JSON, one trial per line """
+    return _chunked(json.dumps(trial) + "\n" for trial in trials)
+
+
+def csv_rows(trials):
+    """ Stream trials as CSV with a header row """
+    def pieces():
+        line = io.StringIO()
+        writer = csv.DictWriter(line, fieldnames=TRIAL_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for trial in trials:
+            writer.writerow(trial)
+            yield line.getvalue()
+            line.seek(0)
+            line.truncate()
+        yield line.getvalue()
+    return _chunked(pieces())
+
+
+def gzip_stream(chunks):
+    """ Gzip a stream of text chunks without holding the whole output in memory """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# format name -> (row streamer, mimetype, file extension)
+FORMATS = {
+    "json": (json_rows, "application/json", "json"),
+    "ndjson": (ndjson_rows, "application/x-ndjson", "ndjson"),
+    "csv": (csv_rows, "text/csv", "csv"),
+}
@@ -0,0 +1,60 @@
+import json
+import os
+import threading
+
+from plot_cache import BackgroundBuilder
+
+FITS_FILE = "fits.json"
+
+
+class FitCache(BackgroundBuilder):
+    """
+    Psychometric fits for every participant, keyed by the trial store's data version.
+
+    /api/psychometrics only ever reads the published fits file; fitting
+    happens in the background (see BackgroundBuilder) when the data version
+    has moved on. The previous fits are handed to fit, so participants
+    without new trials don't have to be refit.
+    """
+
+    thread_name = "psychometric-fitter"
+
+    def __init__(self, directory, version, fit, command=None):
+        super().__init__(directory, version, command)
+        self.fit = fit  # (previously published fits or None) -> fits
+        self._loaded = (None, None)  # (file identity, parsed file), so each worker parses a new file once
+        self._loaded_lock = threading.Lock()
+
+    def published(self):
+        """ The latest published {"version": ..., "fits": ...}, or None if nothing has been fitted yet """
+        path = os.path.join(self.directory, FITS_FILE)
+        try:
+            stat = os.stat(path)
+            identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            with self._loaded_lock:
+                if self._loaded[0] == identity:
+                    return self._loaded[1]
+            with open(path, "r") as file:
+                published = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        with self._loaded_lock:
+            self._loaded = (identity, published)
+        return published
+
+    def published_version(self):
+        published = self.published()
+        return None if published is None else published["version"]
+
+    def rebuild(self):
+        """ Fit now and publish the result; callers are expected to hold the build lock """
+        # Read the version before the data so a trial landing mid-fit
+        # leaves the file stale and gets picked up next time
+        version = self.version()
+        previous = self.published()
+        fits = self.fit(previous["fits"] if previous else None)
+        path = os.path.join(self.directory, FITS_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as file:
+            json.dump({"version": version, "fits": fits}, file)
+        os.replace(tmp, path)  # Readers never see a half-written file
@@ -0,0 +1,103 @@
+import sqlite3
+import threading
+
+
+class ParticipantStats:
+    """
+    Running per-participant totals (trial count, correct count, reaction-time sum).
+
+    The totals live in a small SQLite database in WAL mode so every gunicorn
+    worker updates and reads the same numbers. Each saved trial costs one
+    UPSERT, and the leaderboard only has to look at one row per participant.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS participants ("
+                " name TEXT PRIMARY KEY,"
+                " count INTEGER NOT NULL,"
+                " correct INTEGER NOT NULL,"
+                " reaction_time_sum REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections can't be shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _rows(trials):
+        # Trials without a name never made it onto the old pandas leaderboard either
+        return [
+            (t["name"], 1 if t["correct_guess"] else 0, t["reaction_time"])
+            for t in trials
+            if t.get("name") is not None
+        ]
+
+    @staticmethod
+    def _upsert(conn, rows):
+        conn.executemany(
+            "INSERT INTO participants (name, count, correct, reaction_time_sum) VALUES (?, 1, ?, ?)"
+            " ON CONFLICT(name) DO UPDATE SET"
+            " count = count + 1,"
+            " correct = correct + excluded.correct,"
+            " reaction_time_sum = reaction_time_sum + excluded.reaction_time_sum",
+            rows,
+        )
+
+    def record(self, trial):
+        self.record_many([trial])
+
+    def record_many(self, trials):
+        rows = self._rows(trials)
+        if rows:
+            with self._connect() as conn:
+                self._upsert(conn, rows)
+
+    def rebuild(self, trials):
+        """ Throw away the totals and recompute them from an iterable of trials """
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM participants")
+            self._upsert(conn, self._rows(trials))
+
+    def ensure_built(self, trials):
+        """ Build the totals from the trial log if they have never been built """
+        conn = self._connect()
+        with conn:
+            # Take the write lock first so only one worker does the initial build
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM participants LIMIT 1").fetchone():
+                return
+            self._upsert(conn, self._rows(trials))
+
+    def has_trials(self):
+        return self._connect().execute("SELECT 1 FROM participants LIMIT 1").fetchone() is not None
+
+    def top(self, min_count, limit=3):
+        """
+        Rank participants with at least min_count trials.
+
+        The score weighs accuracy against speed: mean accuracy plus
+        (2 - mean reaction time in seconds) / 2.
+        """
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT name, count, correct, reaction_time_sum FROM participants WHERE count >= ?",
+            (min_count,),
+        ).fetchall()
+        scores = [
+            (name, correct / count + (2 - reaction_time_sum / count / 1000) / 2)
+            for name, count, correct, reaction_time_sum in rows
+        ]
+        scores.sort(key=lambda item: (-item[1], item[0]))
+        return scores[:limit]
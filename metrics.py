@@ -0,0 +1,243 @@
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+try:
+    import fcntl  # POSIX only; gunicorn workers always have it
+except ImportError:
+    fcntl = None
+
+# Upper bounds (seconds) of the latency histogram buckets, as in the Prometheus clients
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+FLUSH_INTERVAL = 1.0  # Seconds between writes of a worker's totals to the shared directory
+WORKER_FILE = re.compile(r"^worker-(\d+)-(\d+)\.json$")  # worker-<pid>-<start time>.json
+RETIRED_FILE = "retired.json"  # Totals of workers that have exited
+RETIRE_LOCK_FILE = ".retire.lock"
+
+HELP = {
+    "http_request_duration_seconds": "Time spent handling a request, by endpoint.",
+    "phase_duration_seconds": "Time spent in an instrumented phase of the app.",
+}
+
+
+class Metrics:
+    """
+    Latency histograms that are summed across gunicorn worker processes.
+
+    Each worker keeps its own histograms in memory, and a background thread
+    writes them to <directory>/worker-<pid>-<start time>.json every
+    FLUSH_INTERVAL seconds while they are changing; the start time keeps a
+    new worker that reuses an old pid from overwriting its file. The
+    /metrics endpoint merges every worker's file, so whichever worker
+    answers the scrape reports the totals for all of them. Files of workers
+    that have exited are folded into retired.json, so counts never go
+    backwards and the directory doesn't grow with every restart.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.periodic = True  # Whether observing starts the background flusher
+        self._histograms = {}  # (metric, ((label, value), ...)) -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # Keeps an older snapshot from replacing a newer one
+        self._dirty = False
+        self._flusher = None
+        self._worker = None  # (pid, file name) of this process
+        os.makedirs(directory, exist_ok=True)
+
+    def observe(self, metric, seconds, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += seconds
+            histogram[-1] += 1
+            self._dirty = True
+            # Started lazily so it runs in each forked gunicorn worker, not the master
+            if self.periodic and (self._flusher is None or not self._flusher.is_alive()):
+                self._flusher = threading.Thread(target=self._flush_periodically, name="metrics-flusher", daemon=True)
+                self._flusher.start()
+
+    @contextmanager
+    def timer(self, phase):
+        """ Time a block as phase_duration_seconds{phase=...} and note it on the current request """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe("phase_duration_seconds", elapsed, phase=phase)
+            if has_request_context():
+                phases = g.setdefault("phases", {})
+                phases[phase] = phases.get(phase, 0.0) + elapsed
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            if self._dirty:
+                self.flush()
+
+    def _entries(self):
+        with self._lock:
+            self._dirty = False
+            return [[metric, list(labels), histogram[:]] for (metric, labels), histogram in self._histograms.items()]
+
+    def _write(self, name, entries):
+        path = os.path.join(self.directory, f"{name}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w") as file:
+            json.dump(entries, file)
+        os.replace(tmp, path)
+
+    def _worker_name(self):
+        pid = os.getpid()
+        # Worked out per pid, since the app may be imported before gunicorn forks
+        if self._worker is None or self._worker[0] != pid:
+            self._worker = (pid, f"worker-{pid}-{time.time_ns()}")
+        return self._worker[1]
+
+    def flush(self):
+        """ Write this worker's totals to the shared directory """
+        with self._flush_lock:
+            self._write(self._worker_name(), self._entries())
+
+    def flush_cumulative(self, name):
+        """
+        Add this process's totals to <directory>/<name>.json.
+
+        For short-lived processes that run one at a time (like the plot
+        renderer), so they share one file instead of leaving one per pid.
+        Such processes should set periodic = False before observing
+        anything, so the same timings aren't also flushed to a worker file.
+        """
+        with self._flush_lock:
+            totals = self._merged([f"{name}.json"])
+            for metric, labels, histogram in self._entries():
+                _add(totals, metric, labels, histogram)
+            self._write(name, [[metric, list(labels), histogram] for (metric, labels), histogram in totals.items()])
+            with self._lock:
+                self._histograms.clear()
+            # Drop anything flushed before then, since it's now counted above
+            if self._worker is not None and self._worker[0] == os.getpid():
+                try:
+                    os.remove(os.path.join(self.directory, f"{self._worker[1]}.json"))
+                except FileNotFoundError:
+                    pass
+
+    def _read(self, entry, default):
+        try:
+            with open(os.path.join(self.directory, entry), "r") as file:
+                return json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return default
+
+    def _merged(self, entries=None):
+        entries = os.listdir(self.directory) if entries is None else entries
+        totals = {}
+        folded = set()
+        if RETIRED_FILE in entries:
+            retired = self._read(RETIRED_FILE, {"folded": [], "entries": []})
+            folded = set(retired["folded"])
+            for metric, labels, histogram in retired["entries"]:
+                _add(totals, metric, labels, histogram)
+        for entry in entries:
+            # Folded files are already counted in retired.json, but may not be deleted yet
+            if not entry.endswith(".json") or entry == RETIRED_FILE or entry in folded:
+                continue
+            for metric, labels, histogram in self._read(entry, []):
+                _add(totals, metric, labels, histogram)
+        return totals
+
+    def retire_exited(self):
+        """ Fold the files of workers that have exited into retired.json and delete them """
+        workers = {}
+        for entry in os.listdir(self.directory):
+            match = WORKER_FILE.match(entry)
+            if match:
+                workers.setdefault(int(match[1]), []).append((int(match[2]), entry))
+        stale = []
+        for pid, files in workers.items():
+            files.sort()
+            # A live pid's newest file is its worker's; older ones are earlier workers that had the pid
+            stale.extend(entry for _, entry in (files[:-1] if _alive(pid) else files))
+        if not stale:
+            return
+        with open(os.path.join(self.directory, RETIRE_LOCK_FILE), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            retired = self._read(RETIRED_FILE, {"folded": [], "entries": []})
+            totals = {}
+            for metric, labels, histogram in retired["entries"]:
+                _add(totals, metric, labels, histogram)
+            # Remembering what was folded keeps a crash before the deletes from counting a file twice
+            present = set(os.listdir(self.directory))
+            folded = {entry for entry in retired["folded"] if entry in present}
+            for entry in stale:
+                if entry in folded or entry not in present:
+                    continue
+                for metric, labels, histogram in self._read(entry, []):
+                    _add(totals, metric, labels, histogram)
+                folded.add(entry)
+            self._write(os.path.splitext(RETIRED_FILE)[0], {
+                "folded": sorted(folded),
+                "entries": [[metric, list(labels), histogram] for (metric, labels), histogram in totals.items()],
+            })
+            for entry in stale:
+                try:
+                    os.remove(os.path.join(self.directory, entry))
+                except FileNotFoundError:
+                    pass
+
+    def render(self):
+        """ All workers' histograms in the Prometheus text exposition format """
+        self.flush()
+        self.retire_exited()
+        lines = []
+        totals = self._merged()
+        for metric in sorted({metric for metric, _ in totals}):
+            lines.append(f"# HELP {metric} {HELP.get(metric, metric)}")
+            lines.append(f"# TYPE {metric} histogram")
+            for (name, labels), histogram in sorted(totals.items()):
+                if name != metric:
+                    continue
+                label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+                prefix = label_text + "," if label_text else ""
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{{prefix}le="+Inf"}} {histogram[-1]}')
+                lines.append(f"{metric}_sum{{{label_text}}} {histogram[-2]}")
+                lines.append(f"{metric}_count{{{label_text}}} {histogram[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _add(totals, metric, labels, histogram):
+    key = (metric, tuple(tuple(label) for label in labels))
+    total = totals.setdefault(key, [0] * len(histogram))
+    for i, value in enumerate(histogram):
+        total[i] += value
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, but belongs to someone else
+    return True
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,192 @@
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+
+try:
+    import fcntl  # POSIX only; gunicorn workers always have it
+except ImportError:
+    fcntl = None
+
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".build.lock"
+BUILD_TIMEOUT = 600  # Seconds before a stuck analytics process is killed
+WATCH_POLL = 0.02  # Seconds between version checks in watch()
+WATCH_IDLE_TIMEOUT = 60  # Seconds without new work before watch() returns
+WATCH_LIFETIME = 300  # Seconds after which watch() returns anyway; well under BUILD_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundBuilder:
+    """
+    Rebuilds something in the background whenever the data version moves on.
+
+    Subclasses publish their output in directory together with the version
+    it was built from (published_version), and implement rebuild(). A
+    non-blocking file lock makes sure only one worker process builds at a
+    time, and the others simply skip the work.
+
+    If command is given, the background thread runs it as a separate
+    analytics process (which should call rebuild() or watch()) instead of
+    building in-process, so web workers never load the analysis stack
+    themselves.
+    """
+
+    thread_name = "background-builder"
+    catch_up = False  # Build again as soon as the lock is free if the version moved on meanwhile
+
+    def __init__(self, directory, version, command=None):
+        self.directory = directory
+        self.version = version  # () -> data version token
+        self.command = command
+        self._wanted = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def published_version(self):
+        """ Version of the latest published build, or None if there is none yet """
+        raise NotImplementedError
+
+    def rebuild(self):
+        """ Build now and publish the result; callers are expected to hold the build lock """
+        raise NotImplementedError
+
+    def refresh(self):
+        """ Ask the background builder to catch up if new trials have arrived """
+        if self.published_version() == self.version():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+                self._thread.start()
+        self._wanted.set()
+
+    def _run(self):
+        while True:
+            self._wanted.wait()
+            self._wanted.clear()
+            try:
+                self._build_if_stale()
+            except Exception:
+                # Keep serving the previous build; the next page view retries
+                logger.exception("%s failed", self.thread_name)
+
+    def _build_if_stale(self):
+        while True:
+            with open(os.path.join(self.directory, LOCK_FILE), "a") as lock:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        return  # Another worker is already building
+                before = self.published_version()
+                if before == self.version():
+                    return
+                if self.command:
+                    subprocess.run(self.command, check=True, timeout=BUILD_TIMEOUT)
+                else:
+                    self.rebuild()
+            # Workers whose work arrived while we held the lock were turned away, so
+            # look again now that it's free (unless the last build got nowhere)
+            after = self.published_version()
+            if not self.catch_up or after == self.version() or after == before:
+                return
+
+    def watch(self, on_build=None):
+        """
+        Rebuild whenever the version moves on, until there's been nothing new for WATCH_IDLE_TIMEOUT.
+
+        For a long-lived analytics process (run as command, so it already
+        holds the build lock), which pays its startup once instead of once
+        per build. Returns after WATCH_LIFETIME at the latest, or as soon as
+        the worker that started it has gone; that worker (or the next one to
+        see new work) starts another if there is more to do.
+        """
+        parent = os.getppid()
+        start = last_build = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if now - last_build > WATCH_IDLE_TIMEOUT or now - start > WATCH_LIFETIME or os.getppid() != parent:
+                return
+            before = self.published_version()
+            if before != self.version():
+                self.rebuild()
+                if self.published_version() != before:
+                    last_build = time.monotonic()
+                    if on_build is not None:
+                        on_build()
+                    continue
+            time.sleep(WATCH_POLL)
+
+
+class PlotCache(BackgroundBuilder):
+    """
+    Rendered plots keyed by the trial store's data version.
+
+    Pages only ever read the manifest, which maps each plot to a
+    content-hashed file name; they never render. When the data version moves
+    on, a background thread (or analytics process, see BackgroundBuilder)
+    re-renders, writes the new files and then swaps the manifest in
+    atomically.
+    """
+
+    thread_name = "plot-renderer"
+
+    def __init__(self, directory, version, render, command=None):
+        super().__init__(directory, version, command)
+        self.render = render  # () -> {file name: PNG bytes}
+
+    def manifest(self):
+        """ The latest finished render, or None if nothing has been rendered yet """
+        try:
+            with open(os.path.join(self.directory, MANIFEST_FILE), "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def published_version(self):
+        manifest = self.manifest()
+        return None if manifest is None else manifest["version"]
+
+    def rebuild(self):
+        """ Render now and publish the result; callers are expected to hold the build lock """
+        # Read the version before the data so a trial landing mid-render
+        # leaves the manifest stale and gets picked up next time
+        version = self.version()
+        previous = self.manifest()
+        files = {name: self._write_hashed(name, data) for name, data in self.render().items()}
+        self._write_manifest({"version": version, "files": files})
+        self._prune(files, previous)
+
+    def _write_hashed(self, name, data):
+        stem, ext = os.path.splitext(name)
+        hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:16]}{ext}"
+        path = os.path.join(self.directory, hashed)
+        if not os.path.exists(path):
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as file:
+                file.write(data)
+            os.replace(tmp, path)  # Readers never see a half-written PNG
+        return hashed
+
+    def _write_manifest(self, manifest):
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as file:
+            json.dump(manifest, file)
+        os.replace(tmp, path)
+
+    def _prune(self, files, previous):
+        # Keep the previous generation too, for pages that are still loading it
+        keep = set(files.values()) | set((previous or {}).get("files", {}).values())
+        for entry in os.listdir(self.directory):
+            if entry.endswith(".png") and entry not in keep:
+                try:
+                    os.remove(os.path.join(self.directory, entry))
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,90 @@
+import io
+from contextlib import nullcontext
+
+import matplotlib
+matplotlib.use('Agg')  # Use a non-GUI backend to prevent threading issues
+from matplotlib.figure import Figure
+import pandas as pd
+import numpy as np
+
+
+def _png_bytes(fig, timer):
+    buffer = io.BytesIO()
+    with timer("savefig"):
+        fig.savefig(buffer, format="png")
+    return buffer.getvalue()
+
+
+# Generate desired plots, returned as {file name: PNG bytes}
+# timer(phase) is an optional context manager used to time the expensive steps
+def generate_plot(results, coherence_bound, timer=None):
+    timer = timer or (lambda phase: nullcontext())
+    if not results:
+        return {}  # No data to plot
+
+    results = [entry for entry in results if entry["reaction_time"] > 200]
+    if not results:
+        return {}
+
+    with timer("build_dataframe"):
+        df = pd.DataFrame(results)
+    df['choice_right'] = df['user'] == 'right'
+
+    num_bins = 10  # Adjust based on data density
+    df['coherence_bin'] = pd.cut(
+        df['coherence'],
+        bins=np.linspace(-coherence_bound, coherence_bound, num_bins + 1),
+        labels=False,
+        include_lowest=True
+    )
+
+    bin_means = df.groupby('coherence_bin')['coherence'].mean()
+    prob_right = df.groupby('coherence_bin')['choice_right'].mean()
+    plots = {}
+
+    # --- P(Choosing Right) vs. Coherence ---
+    fig = Figure(figsize=(6, 4))
+    ax = fig.subplots()
+    ax.plot(bin_means, prob_right, marker='o', linestyle='-', label="P(choose right)")
+    ax.set_xlabel("Coherence Value")
+    ax.set_ylabel("P(Choose Right)")
+    ax.set_title("P(Choosing Right) vs. Coherence")
+    ax.set_ylim(0, 1.2)
+    ax.set_xlim(-coherence_bound, coherence_bound)
+    ax.axhline(0.5, linestyle="--", color="gray", alpha=0.6)
+    ax.axvline(0, linestyle="--", color="gray", alpha=0.6)
+    ax.grid()
+    plots["prob_choose_right.png"] = _png_bytes(fig, timer)
+
+    # --- Reaction Time vs. Coherence ---
+    coherence = [r["coherence"] for r in results]
+    reaction_times = [r["reaction_time"] for r in results]
+    correct_guesses = [r["correct_guess"] for r in results]
+    colors = ["green" if correct else "red" for correct in correct_guesses]
+
+    fig = Figure(figsize=(6, 4))
+    ax = fig.subplots()
+    ax.scatter(coherence, reaction_times, c=colors, edgecolors="black")
+    ax.set_xlabel("Coherence")
+    ax.set_ylabel("Reaction Times (ms)")
+    ax.set_title("Reaction Time vs Coherence")
+    ax.set_ylim(0, 2200)
+    ax.set_xlim(-coherence_bound, coherence_bound)
+    ax.grid(True)
+    plots["reaction_time_vs_coherence.png"] = _png_bytes(fig, timer)
+
+    # --- Probability Correct vs. Coherence ---
+    percentage_correct = df.groupby('coherence_bin')['correct_guess'].mean()
+
+    fig = Figure(figsize=(6, 4))
+    ax = fig.subplots()
+    ax.plot(bin_means, percentage_correct, marker='o', linestyle='-')
+    ax.set_xlabel("Coherence Bin")
+    ax.set_ylabel("Probability Correct")
+    ax.set_title("Probability Correct vs Coherence")
+    ax.set_ylim(0, 1.2)
+    ax.set_xlim(-coherence_bound, coherence_bound)
+    ax.grid(True)
+    plots["probability_correct.png"] = _png_bytes(fig, timer)
+
+    return plots
@@ -0,0 +1,115 @@
+import json
+import os
+import sqlite3
+import threading
+
+from plot_cache import BackgroundBuilder
+
+DATABASE_FILE = "realized.db"
+FIELDS = ["realized_coherence", "motion_energy", "mean_realized_coherence", "mean_motion_energy"]
+BATCH_SIZE = 1000  # Seeded trials analyzed (and committed) at a time
+LOOKUP_BATCH_SIZE = 500  # Keys per lookup; stays under SQLite's limit on query parameters
+
+
+class RealizedStats(BackgroundBuilder):
+    """
+    The stimulus each seeded trial actually showed, kept beside the trial store.
+
+    Regenerating a stimulus is far too slow for the request that saves the
+    trial, so the analytics process (see BackgroundBuilder) works through the
+    store from the last trial it reached and writes each trial's FIELDS to a
+    SQLite table keyed by the store's scan key (byte offset or row id).
+    Downloads join them back onto the trials with merge().
+    """
+
+    thread_name = "stimulus-analyzer"
+    catch_up = True
+
+    def __init__(self, directory, scan, version, analyze, command=None):
+        super().__init__(directory, version, command)
+        self.scan = scan  # (cursor) -> (key, trial) for every trial after cursor
+        self.analyze = analyze  # (trials) -> None, adding FIELDS to each seeded trial
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS realized ("
+                " key INTEGER PRIMARY KEY,"
+                " data TEXT NOT NULL)"
+            )
+            # One row: the last scan key analyzed, and the store version it covers once finished
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS progress ("
+                " id INTEGER PRIMARY KEY CHECK (id = 1),"
+                " cursor INTEGER NOT NULL,"
+                " version)"
+            )
+            conn.execute("INSERT OR IGNORE INTO progress (id, cursor, version) VALUES (1, 0, NULL)")
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections can't be shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.directory, DATABASE_FILE), timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _progress(self):
+        return self._connect().execute("SELECT cursor, version FROM progress WHERE id = 1").fetchone()
+
+    def published_version(self):
+        return self._progress()[1]
+
+    def rebuild(self):
+        """ Analyze every trial added since the last run; callers are expected to hold the build lock """
+        # Read the version before the data so a trial landing mid-run
+        # leaves the table stale and gets picked up next time
+        version = self.version()
+        cursor = self._progress()[0]
+        conn = self._connect()
+        if version < cursor:
+            # Keys only grow, so the store was emptied or replaced; start again
+            with conn:
+                conn.execute("DELETE FROM realized")
+            cursor = 0
+        batch = []
+        for key, trial in self.scan(cursor):
+            cursor = key
+            if trial.get("stimulus_seed") is not None:
+                batch.append((key, trial))
+            if len(batch) == BATCH_SIZE:
+                self._write(batch, cursor)
+                batch = []
+        self._write(batch, cursor, version)
+
+    def _write(self, batch, cursor, version=None):
+        # A killed run picks up after the last batch it committed
+        self.analyze([trial for _, trial in batch])
+        rows = [(key, json.dumps({field: trial[field] for field in FIELDS})) for key, trial in batch]
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO realized (key, data) VALUES (?, ?)", rows)
+            conn.execute("UPDATE progress SET cursor = ?, version = ? WHERE id = 1", (cursor, version))
+
+    def merge(self, scanned):
+        """ Yield the trials from (key, trial) pairs, with FIELDS added wherever they've been computed """
+        batch = []
+        for item in scanned:
+            batch.append(item)
+            if len(batch) == LOOKUP_BATCH_SIZE:
+                yield from self._merge_batch(batch)
+                batch = []
+        yield from self._merge_batch(batch)
+
+    def _merge_batch(self, batch):
+        keys = [key for key, trial in batch if trial.get("stimulus_seed") is not None]
+        found = {}
+        if keys:
+            rows = self._connect().execute(
+                f"SELECT key, data FROM realized WHERE key IN ({','.join('?' * len(keys))})", keys,
+            )
+            found = {key: json.loads(data) for key, data in rows}
+        for key, trial in batch:
+            if key in found:
+                trial.update(found[key])
+            yield trial
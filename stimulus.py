@@ -0,0 +1,99 @@
+import math
+
+import numpy as np
+
+# Same rules as the browser engine in templates/index.html
+NUM_DOTS = 1000
+DOT_SPEED = 3  # Pixels per frame
+CANVAS_SIZE = 600  # The canvas is square
+RESAMPLE_MS = 20  # How often the coherent dots are re-picked
+FRAME_MS = 1000 / 60  # One requestAnimationFrame at 60 Hz
+DURATION_MS = 2000  # Reaction times are capped here, so nothing later is ever scored
+NUM_FRAMES = math.ceil(DURATION_MS / FRAME_MS)
+POSITION_SCALE = 100  # Positions are sent as little-endian uint16 hundredths of a pixel
+
+
+def resample_index(num_frames=NUM_FRAMES):
+    """ Which resample of coherent dots is in effect on each frame """
+    return (np.arange(num_frames) * FRAME_MS // RESAMPLE_MS).astype(int)
+
+
+def _draw(rng, coherence, num_resamples):
+    """
+    Draw a trial's starting positions and the angles of its random dots.
+
+    Every resample has exactly floor(coherence * NUM_DOTS) coherent dots,
+    like resampleCoherence() in the browser, and every other dot gets a
+    fresh random angle. Which dots are coherent is drawn afterwards (see
+    _plan), so statistics that don't care can stop here.
+    """
+    num_coherent = int(math.floor(coherence * NUM_DOTS))
+    start = rng.random((NUM_DOTS, 2)) * CANVAS_SIZE
+    random_angles = rng.random((num_resamples, NUM_DOTS - num_coherent), dtype=np.float32) * np.float32(2 * math.pi)
+    return num_coherent, start, random_angles
+
+
+def _plan(seed, coherence, direction, num_resamples):
+    """ Starting positions and every dot's angle in each resample, as (NUM_DOTS, 2) and (resamples, NUM_DOTS) """
+    rng = np.random.default_rng(seed)
+    num_coherent, start, random_angles = _draw(rng, coherence, num_resamples)
+    angles = np.full((num_resamples, NUM_DOTS), math.pi if direction == "left" else 0.0, dtype=np.float32)
+    if num_coherent < NUM_DOTS:
+        # The dots with the largest keys in each row are that resample's random dots
+        keys = rng.random((num_resamples, NUM_DOTS), dtype=np.float32)
+        random_dots = np.argpartition(keys, num_coherent, axis=1)[:, num_coherent:]
+        np.put_along_axis(angles, random_dots, random_angles, axis=1)
+    return start, angles
+
+
+def frames(seed, coherence, direction, num_frames=NUM_FRAMES):
+    """
+    Dot positions for one trial as a (num_frames, NUM_DOTS, 2) float32 array.
+
+    Frame f is what the browser draws f frames after the trial starts: every
+    dot has already taken f + 1 steps, wrapping at the canvas edges.
+    """
+    index = resample_index(num_frames)
+    position, angles = _plan(seed, coherence, direction, index[-1] + 1)
+    steps = DOT_SPEED * np.stack([np.cos(angles), np.sin(angles)], axis=-1)
+    out = np.empty((num_frames, NUM_DOTS, 2), dtype=np.float32)
+    for f, k in enumerate(index):
+        position += steps[k]
+        position[position < 0] = CANVAS_SIZE
+        position[position > CANVAS_SIZE] = 0
+        out[f] = position
+    return out
+
+
+def encode(positions):
+    """ Quantize frames() output to the uint16 bytes sent to the browser (half the size of float32) """
+    return np.rint(positions * POSITION_SCALE).astype("<u2").tobytes()
+
+
+def realized(seeds, coherences, directions, num_frames=NUM_FRAMES):
+    """
+    Realized per-frame coherence and motion energy for a batch of trials.
+
+    Both are signed like stored coherences (positive means rightward):
+    realized coherence is the dots' mean horizontal velocity as a fraction
+    of their speed, and motion energy is the opponent (right minus left)
+    horizontal energy per dot. Returns two (trials, num_frames) arrays.
+    Positions aren't needed, so thousands of trials take seconds.
+    """
+    index = resample_index(num_frames)
+    num_resamples = index[-1] + 1
+    coherence = np.empty((len(seeds), num_resamples))
+    energy = np.empty((len(seeds), num_resamples))
+    for i, (seed, nominal, direction) in enumerate(zip(seeds, coherences, directions)):
+        num_coherent, _, random_angles = _draw(np.random.default_rng(seed), nominal, num_resamples)
+        # Coherent dots move at +/-1 speed horizontally, so they add the same to both sums
+        signal = num_coherent * (-1 if direction == "left" else 1)
+        dx = np.cos(random_angles)
+        coherence[i] = (signal + dx.sum(axis=1)) / NUM_DOTS
+        energy[i] = (signal + (dx * np.abs(dx)).sum(axis=1)) / NUM_DOTS
+    return coherence[:, index], energy[:, index]
+
+
+def frames_shown(reaction_time, num_frames=NUM_FRAMES):
+    """ How many frames were on screen before a response after reaction_time ms """
+    return max(1, min(num_frames, int(reaction_time // FRAME_MS) + 1))
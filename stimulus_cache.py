@@ -0,0 +1,153 @@
+import json
+import os
+import time
+
+from plot_cache import BackgroundBuilder
+
+try:
+    import fcntl  # POSIX only; gunicorn workers always have it
+except ImportError:
+    fcntl = None
+
+QUEUE_FILE = "queue.jsonl"
+RENDERED_FILE = "rendered.json"
+MAX_AGE = 60 * 60  # Seconds a rendered stimulus is kept; a block is played well within this
+ROTATE_SIZE = 1024 * 1024  # Bytes of fully rendered queue before it is emptied
+PRUNE_INTERVAL = 60  # Seconds between sweeps for expired stimuli
+PENDING_SUFFIX = ".pending"  # Marks a stimulus that was handed out but isn't rendered yet
+
+
+def stimulus_file(seed, coherence, direction):
+    """ File name of a rendered stimulus; coherence is a float, as drawn for the trial """
+    return f"{seed}-{float(coherence)!r}-{direction}.bin"
+
+
+class StimulusCache(BackgroundBuilder):
+    """
+    Dot stimuli rendered ahead of time, so web workers never generate them.
+
+    Workers append the trials they hand out to a queue file and serve the
+    finished files. The renderer (see BackgroundBuilder, normally a
+    long-lived process in watch()) works through the queue from the offset
+    it last reached, writes one file per stimulus, and deletes files older
+    than MAX_AGE. Each queued stimulus has an empty marker file until it
+    is rendered, so workers can tell a stimulus that is on its way from one
+    that was never handed out (or has expired), which they refuse.
+    """
+
+    thread_name = "stimulus-renderer"
+    catch_up = True
+
+    def __init__(self, directory, render, command=None):
+        super().__init__(directory, self._queue_size, command)
+        self.render = render  # (seed, coherence, direction) -> bytes
+        self._pruned_at = 0.0
+
+    def _queue_size(self):
+        try:
+            return os.path.getsize(os.path.join(self.directory, QUEUE_FILE))
+        except FileNotFoundError:
+            return 0
+
+    def request(self, trials):
+        """ Queue the stimuli of trials (from draw_trial) and wake the renderer """
+        for trial in trials:
+            # Marked before it is queued, so the renderer always finds the marker to clear
+            marker = os.path.join(self.directory, stimulus_file(
+                trial["stimulus_seed"], trial["coherence"], trial["direction"],
+            ) + PENDING_SUFFIX)
+            open(marker, "a").close()
+        payload = "".join(
+            json.dumps([trial["stimulus_seed"], trial["coherence"], trial["direction"]]) + "\n" for trial in trials
+        )
+        with open(os.path.join(self.directory, QUEUE_FILE), "a") as file:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX)  # Released when the file closes
+            file.write(payload)
+        self.refresh()
+
+    def path(self, seed, coherence, direction):
+        """ The rendered file for a stimulus, or None if it isn't ready """
+        name = stimulus_file(seed, coherence, direction)
+        return name if os.path.exists(os.path.join(self.directory, name)) else None
+
+    def pending(self, seed, coherence, direction):
+        """ Whether a stimulus was queued and is still waiting for the renderer """
+        name = stimulus_file(seed, coherence, direction) + PENDING_SUFFIX
+        return os.path.exists(os.path.join(self.directory, name))
+
+    def published_version(self):
+        try:
+            with open(os.path.join(self.directory, RENDERED_FILE), "r") as file:
+                return json.load(file)["offset"]
+        except (FileNotFoundError, json.JSONDecodeError):
+            return 0
+
+    def _publish(self, offset):
+        path = os.path.join(self.directory, RENDERED_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as file:
+            json.dump({"offset": offset}, file)
+        os.replace(tmp, path)
+
+    def rebuild(self):
+        """ Render everything queued and publish how far we got; callers are expected to hold the build lock """
+        # Keep going until the queue stops growing, since workers that queued
+        # stimuli meanwhile couldn't start a renderer of their own
+        while True:
+            offset = self.published_version()
+            end = self.version()
+            if offset > end:
+                self._publish(0)  # The queue was emptied or replaced; start again from the top
+                continue
+            if offset == end:
+                break
+            with open(os.path.join(self.directory, QUEUE_FILE), "rb") as file:
+                file.seek(offset)
+                data = file.read(end - offset)
+            data = data[:data.rfind(b"\n") + 1]  # A line still being written waits for the next pass
+            if not data:
+                break
+            for line in data.splitlines():
+                seed, coherence, direction = json.loads(line)
+                path = os.path.join(self.directory, stimulus_file(seed, coherence, direction))
+                if os.path.exists(path):
+                    os.utime(path)  # Handed out again, so it mustn't expire before it is played
+                else:
+                    tmp = path + ".tmp"
+                    with open(tmp, "wb") as file:
+                        file.write(self.render(seed, coherence, direction))
+                    os.replace(tmp, path)  # Readers never see a half-written stimulus
+                try:
+                    os.remove(path + PENDING_SUFFIX)
+                except FileNotFoundError:
+                    pass  # The same stimulus was queued twice
+            self._publish(offset + len(data))
+        self._prune()
+        self._rotate()
+
+    def _prune(self):
+        if time.monotonic() - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = time.monotonic()
+        cutoff = time.time() - MAX_AGE
+        for entry in os.listdir(self.directory):
+            if not entry.endswith((".bin", ".bin" + PENDING_SUFFIX)):
+                continue
+            path = os.path.join(self.directory, entry)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _rotate(self):
+        # Empty the queue once it is all rendered, so it doesn't grow forever
+        if self.version() < ROTATE_SIZE:
+            return
+        with open(os.path.join(self.directory, QUEUE_FILE), "a") as file:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX)  # Keeps appends out until we're done
+            if os.fstat(file.fileno()).st_size == self.published_version():
+                file.truncate(0)
+                self._publish(0)
@@ -0,0 +1,260 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl  # POSIX only; gunicorn workers always have it
+except ImportError:
+    fcntl = None
+
+
+@contextmanager
+def _locked(file, exclusive=True):
+    """ Hold an advisory lock on an open file for the duration of the block """
+    if fcntl is None:
+        yield file
+        return
+    fcntl.flock(file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    try:
+        yield file
+    finally:
+        fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+def _read_legacy(path):
+    """ Read the old pretty-printed results.json array, if there is one """
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as file:
+        try:
+            results = json.load(file)
+        except json.JSONDecodeError:
+            return []
+    return results if isinstance(results, list) else []
+
+
+def _matches(trial, name, min_coherence, max_coherence):
+    if name is not None and trial.get("name") != name:
+        return False
+    coherence = trial.get("coherence")
+    if min_coherence is not None and (coherence is None or coherence < min_coherence):
+        return False
+    if max_coherence is not None and (coherence is None or coherence > max_coherence):
+        return False
+    return True
+
+
+class JsonLinesStore:
+    """
+    Append-only trial log with one JSON object per line.
+
+    Every write is a single O_APPEND write made under an exclusive flock, so
+    concurrent gunicorn workers can never interleave or drop each other's
+    trials. A line cut short by a crash is skipped when reading.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, trial):
+        self.extend([trial])
+
+    def extend(self, trials):
+        payload = "".join(json.dumps(trial) + "\n" for trial in trials)
+        if not payload:
+            return
+        with open(self.path, "ab+") as file, _locked(file):
+            # Start on a fresh line if a crashed writer left a torn one behind
+            size = os.fstat(file.fileno()).st_size
+            if size:
+                file.seek(size - 1)
+                if file.read(1) != b"\n":
+                    payload = "\n" + payload
+            file.write(payload.encode("utf-8"))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _end(self):
+        # Everything before this offset was written by a finished append
+        with open(self.path, "r") as file, _locked(file, exclusive=False):
+            return os.fstat(file.fileno()).st_size
+
+    def scan(self, cursor=0):
+        """
+        Yield (key, trial) for complete lines after cursor.
+
+        The key is the byte offset just past the trial's line: unique, only
+        ever growing, and usable as a page cursor.
+        """
+        if not os.path.exists(self.path):
+            return
+        end = self._end()
+        # Read without holding the lock so a long download never blocks writers
+        with open(self.path, "rb") as file:
+            file.seek(cursor)
+            offset = cursor
+            while offset < end:
+                line = file.readline(end - offset)
+                if not line:
+                    break
+                offset += len(line)
+                if not line.endswith(b"\n"):
+                    continue  # Torn line from a crashed writer
+                try:
+                    yield offset, json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def iter_results(self):
+        for _, trial in self.scan():
+            yield trial
+
+    def page(self, cursor=0, limit=100, name=None, min_coherence=None, max_coherence=None):
+        """
+        Return (trials, next_cursor) for up to limit matching trials after cursor.
+
+        The cursor is a byte offset into the log, so next_cursor stays valid
+        however many trials are appended later. It is None on the last page.
+        """
+        trials = []
+        for offset, trial in self.scan(cursor or 0):
+            if _matches(trial, name, min_coherence, max_coherence):
+                trials.append(trial)
+                if len(trials) == limit:
+                    return trials, offset
+        return trials, None
+
+    def load(self):
+        return list(self.iter_results())
+
+    def version(self):
+        """ Cheap token that changes whenever a trial is added (the log's size) """
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def migrate_legacy(self, legacy_path):
+        """ Copy trials from an old results.json into an empty log (runs once) """
+        with open(self.path, "a") as file, _locked(file):
+            if os.fstat(file.fileno()).st_size > 0:
+                return 0
+            results = _read_legacy(legacy_path)
+            file.write("".join(json.dumps(trial) + "\n" for trial in results))
+            file.flush()
+            os.fsync(file.fileno())
+        return len(results)
+
+
+class SQLiteStore:
+    """
+    Trial store backed by a local SQLite database in WAL mode.
+
+    WAL lets the results page read while a worker is appending. Each trial is
+    kept as its JSON document alongside the columns we filter on.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS trials ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " name TEXT,"
+                " coherence REAL,"
+                " data TEXT NOT NULL)"
+            )
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections can't be shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, trial):
+        self.extend([trial])
+
+    def extend(self, trials):
+        rows = [(t.get("name"), t.get("coherence"), json.dumps(t)) for t in trials]
+        with self._connect() as conn:
+            conn.executemany("INSERT INTO trials (name, coherence, data) VALUES (?, ?, ?)", rows)
+
+    def iter_results(self):
+        cursor = self._connect().execute("SELECT data FROM trials ORDER BY id")
+        for (data,) in cursor:
+            yield json.loads(data)
+
+    def scan(self, cursor=0):
+        """ Yield (key, trial) for trials after cursor; the key is the row id """
+        rows = self._connect().execute("SELECT id, data FROM trials WHERE id > ? ORDER BY id", (cursor,))
+        for key, data in rows:
+            yield key, json.loads(data)
+
+    def page(self, cursor=0, limit=100, name=None, min_coherence=None, max_coherence=None):
+        """
+        Return (trials, next_cursor) for up to limit matching trials after cursor.
+
+        The cursor is the last row id returned. It is None on the last page.
+        """
+        query = "SELECT id, data FROM trials WHERE id > ?"
+        params = [cursor or 0]
+        if name is not None:
+            query += " AND name = ?"
+            params.append(name)
+        if min_coherence is not None:
+            query += " AND coherence >= ?"
+            params.append(min_coherence)
+        if max_coherence is not None:
+            query += " AND coherence <= ?"
+            params.append(max_coherence)
+        query += " ORDER BY id LIMIT ?"
+        params.append(limit + 1)
+        rows = self._connect().execute(query, params).fetchall()
+        trials = [json.loads(data) for _, data in rows[:limit]]
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return trials, next_cursor
+
+    def load(self):
+        return list(self.iter_results())
+
+    def version(self):
+        """ Cheap token that changes whenever a trial is added (the last row id) """
+        (last_id,) = self._connect().execute("SELECT COALESCE(MAX(id), 0) FROM trials").fetchone()
+        return last_id
+
+    def migrate_legacy(self, legacy_path):
+        """ Copy trials from an old results.json into an empty database (runs once) """
+        conn = self._connect()
+        with conn:
+            # Take the write lock first so only one worker can do the import
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM trials LIMIT 1").fetchone():
+                return 0
+            results = _read_legacy(legacy_path)
+            conn.executemany(
+                "INSERT INTO trials (name, coherence, data) VALUES (?, ?, ?)",
+                [(t.get("name"), t.get("coherence"), json.dumps(t)) for t in results],
+            )
+        return len(results)
+
+
+BACKENDS = {
+    "jsonl": JsonLinesStore,
+    "sqlite": SQLiteStore,
+}
+
+
+def open_store(backend, path):
+    """ Build the trial store named by backend ("jsonl" or "sqlite") """
+    try:
+        store_class = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown storage backend {backend!r}, expected one of {sorted(BACKENDS)}")
+    return store_class(path)
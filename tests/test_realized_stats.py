@@ -0,0 +1,72 @@
+import pytest
+
+import realized_stats
+import storage
+
+
+def seeded_trial(i, seed=True):
+    trial = {"name": "alice", "coherence": 0.1, "reaction_time": 500}
+    if seed:
+        trial["stimulus_seed"] = i
+    return trial
+
+
+def fake_analyze(calls):
+    def analyze(trials):
+        calls.append(len(trials))
+        for trial in trials:
+            trial["realized_coherence"] = [trial["stimulus_seed"] / 10]
+            trial["motion_energy"] = [1.0]
+            trial["mean_realized_coherence"] = trial["stimulus_seed"] / 10
+            trial["mean_motion_energy"] = 1.0
+    return analyze
+
+
+@pytest.fixture(params=sorted(storage.BACKENDS))
+def store(request, tmp_path):
+    return storage.open_store(request.param, str(tmp_path / f"results.{request.param}"))
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def stats(store, tmp_path, calls):
+    return realized_stats.RealizedStats(
+        str(tmp_path / "stats"), scan=store.scan, version=store.version, analyze=fake_analyze(calls),
+    )
+
+
+def test_rebuild_stores_fields_for_seeded_trials_only(store, stats):
+    store.extend([seeded_trial(1), seeded_trial(2, seed=False), seeded_trial(3)])
+    stats.rebuild()
+
+    assert stats.published_version() == store.version()
+    merged = list(stats.merge(store.scan()))
+    assert [trial.get("mean_realized_coherence") for trial in merged] == [0.1, None, 0.3]
+    assert merged[0]["realized_coherence"] == [0.1]
+
+
+def test_rebuild_only_analyzes_new_trials(store, stats, calls):
+    store.extend([seeded_trial(1)])
+    stats.rebuild()
+    store.extend([seeded_trial(2), seeded_trial(3)])
+    assert stats.published_version() != store.version()
+    stats.rebuild()
+
+    assert calls == [1, 2]
+    assert [trial["mean_motion_energy"] for trial in stats.merge(store.scan())] == [1.0, 1.0, 1.0]
+
+
+def test_merge_leaves_trials_that_are_not_analyzed_yet_alone(store, stats):
+    store.extend([seeded_trial(1)])
+    assert list(stats.merge(store.scan())) == [seeded_trial(1)]
+
+
+def test_merge_looks_keys_up_in_batches(store, stats, monkeypatch):
+    monkeypatch.setattr(realized_stats, "LOOKUP_BATCH_SIZE", 2)
+    store.extend([seeded_trial(i) for i in range(5)])
+    stats.rebuild()
+    assert [trial["mean_realized_coherence"] for trial in stats.merge(store.scan())] == [i / 10 for i in range(5)]
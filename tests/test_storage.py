@@ -0,0 +1,128 @@
+import json
+import multiprocessing
+import os
+
+import pytest
+
+import storage
+
+STORE_FILES = {"jsonl": "results.jsonl", "sqlite": "results.db"}
+
+
+def make_trial(i, name="alice"):
+    return {"name": name, "coherence": round(i / 100, 2), "reaction_time": 500 + i}
+
+
+@pytest.fixture(params=sorted(storage.BACKENDS))
+def store(request, tmp_path):
+    return storage.open_store(request.param, str(tmp_path / STORE_FILES[request.param]))
+
+
+def _append_many(backend, path, worker, count):
+    store = storage.open_store(backend, path)
+    for i in range(count):
+        if i % 2:
+            store.append({"name": f"w{worker}", "coherence": 0.1, "i": i})
+        else:
+            store.extend([{"name": f"w{worker}", "coherence": 0.1, "i": i}])
+
+
+def test_concurrent_appends_from_several_processes_are_all_kept(store):
+    backend = "jsonl" if isinstance(store, storage.JsonLinesStore) else "sqlite"
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_append_many, args=(backend, store.path, w, 200)) for w in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    trials = list(store.iter_results())
+    assert len(trials) == 800
+    for w in range(4):
+        assert sorted(t["i"] for t in trials if t["name"] == f"w{w}") == list(range(200))
+
+
+def test_torn_line_is_skipped_and_next_append_starts_a_fresh_line(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    store = storage.JsonLinesStore(path)
+    store.extend([make_trial(1), make_trial(2)])
+    with open(path, "ab") as file:
+        file.write(b'{"name": "crashed", "coher')  # A writer died mid-line
+
+    assert list(store.iter_results()) == [make_trial(1), make_trial(2)]
+
+    store.append(make_trial(3))
+    assert list(store.iter_results()) == [make_trial(1), make_trial(2), make_trial(3)]
+
+
+def test_migrate_legacy_imports_once(store, tmp_path):
+    legacy = tmp_path / "results.json"
+    legacy.write_text(json.dumps([make_trial(1), make_trial(2)], indent=4))
+
+    assert store.migrate_legacy(str(legacy)) == 2
+    assert store.migrate_legacy(str(legacy)) == 0
+    assert list(store.iter_results()) == [make_trial(1), make_trial(2)]
+
+
+def test_migrate_legacy_without_a_legacy_file(store, tmp_path):
+    assert store.migrate_legacy(str(tmp_path / "missing.json")) == 0
+    assert list(store.iter_results()) == []
+
+
+def test_page_walks_every_trial_with_the_cursor(store):
+    trials = [make_trial(i) for i in range(25)]
+    store.extend(trials)
+
+    seen = []
+    cursor = 0
+    while cursor is not None:
+        page, cursor = store.page(cursor=cursor, limit=10)
+        assert len(page) <= 10
+        seen.extend(page)
+    assert seen == trials
+
+
+def test_page_cursor_stays_valid_after_more_appends(store):
+    store.extend([make_trial(i) for i in range(10)])
+    first, cursor = store.page(cursor=0, limit=5)
+    store.extend([make_trial(i) for i in range(10, 12)])
+
+    rest = []
+    while cursor is not None:
+        page, cursor = store.page(cursor=cursor, limit=5)
+        rest.extend(page)
+    assert first + rest == [make_trial(i) for i in range(12)]
+
+
+def test_page_filters_by_name_and_coherence(store):
+    store.extend([make_trial(i, name="alice" if i % 2 else "bob") for i in range(40)])
+
+    page, cursor = store.page(cursor=0, limit=100, name="bob", min_coherence=0.1, max_coherence=0.2)
+    assert cursor is None
+    assert page == [make_trial(i, name="bob") for i in (10, 12, 14, 16, 18, 20)]
+
+
+def test_page_on_an_empty_store(store):
+    assert store.page(cursor=0, limit=10) == ([], None)
+
+
+def test_version_changes_when_a_trial_is_added(store):
+    before = store.version()
+    store.append(make_trial(1))
+    assert store.version() != before
+
+
+def test_open_store_rejects_unknown_backends(tmp_path):
+    with pytest.raises(ValueError):
+        storage.open_store("csv", str(tmp_path / "results.csv"))
+
+
+def test_scan_keys_resume_after_the_last_trial_seen(store):
+    store.extend([make_trial(i) for i in range(5)])
+    scanned = list(store.scan())
+    assert [trial for _, trial in scanned] == [make_trial(i) for i in range(5)]
+    assert [key for key, _ in scanned] == sorted(set(key for key, _ in scanned))
+
+    store.extend([make_trial(5)])
+    assert list(store.scan(scanned[-1][0])) == [(store.version(), make_trial(5))]